@@ -5,12 +5,19 @@ import pandas as pd
 from datetime import datetime
 import os
 import io
-from PIL import Image
-import numpy as np
-import base64
+import hashlib
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit.components.v1 as components
-from vr_utils import create_aframe_scene
-from depth_utils import estimate_depth
+from vr_utils import create_aframe_scene, make_displacement_map, write_asset, check_vendor_assets
+from vr_utils import make_gallery_entry, create_vr_gallery, VR_VENDOR_DIR
+from depth_utils import estimate_depth, DEPTH_WORKING_MAX_SIDE
+from overlay_utils import build_overlay, filter_overlay, composite_overlay
+from detections import Detections
+from session_store import SessionResultStore
+from evidence_index import EvidenceIndex, EVIDENCE_INDEX_PATH
+from image_io import decode_image_bytes, reusable_mime, encode_for_export
 
 # Page configuration
 st.set_page_config(
@@ -774,10 +781,21 @@ st.markdown("""
 
 
 class EnsembleEvidenceDetector:
-    def __init__(self, standard_weights='yolov8l.pt', custom_weights='best.pt'):
+    def __init__(self, standard_weights='yolov8l.pt', custom_weights='best.pt', preview_weights='yolov8n.pt'):
         """Initialize BOTH models to cover all evidence types."""
         self.model_standard = YOLO(standard_weights)
         
+        # The detector is shared by every session (get_detector) and the
+        # background executor; Ultralytics predictors are not thread-safe,
+        # so each model is used by one thread at a time. One lock per model
+        # keeps the preview running alongside the full-resolution pass.
+        self._locks = {"standard": threading.Lock(), "custom": threading.Lock(), "preview": threading.Lock()}
+        
+        # Small model for the quick preview, loaded on first use
+        self.preview_weights = preview_weights
+        self.model_preview = None
+        self.PREVIEW_MAX_SIDE = 320
+        
         if os.path.exists(custom_weights):
             self.model_custom = YOLO(custom_weights)
         else:
@@ -812,112 +830,288 @@ class EnsembleEvidenceDetector:
         }
     
     def analyze_image(self, img):
-        """Analyze a single image and return results."""
-        img_h, img_w = img.shape[:2]
-        master_log = []
-        
+        """Analyze a single image and return (overlay, detections)."""
+        return self.analyze_batch([img])[0]
+    
+    def analyze_batch(self, imgs):
+        """
+        Analyze a list of images with one batched predict call per model.
+        Returns a list of (overlay, detections), one per image.
+        """
         # PASS 1: STANDARD MODEL
-        res_std = self.model_standard.predict(img, conf=0.001, iou=0.5, verbose=False)[0]
-        for box in res_std.boxes:
-            cls_id = int(box.cls[0])
-            if cls_id in self.std_classes:
-                master_log.append({
-                    "Source": "Standard_Model",
-                    "Label": self.std_classes[cls_id],
-                    "Conf": float(box.conf[0]),
-                    "Box": box.xyxy[0].tolist()
-                })
+        with self._locks["standard"]:
+            res_std = self.model_standard.predict(imgs, conf=0.001, iou=0.5, verbose=False)
         
         # PASS 2: CUSTOM MODEL (Guns/Blood)
         if self.model_custom:
-            res_cust = self.model_custom.predict(img, conf=0.001, iou=0.5, verbose=False)[0]
-            for box in res_cust.boxes:
-                cls_id = int(box.cls[0])
-                if cls_id in self.cust_classes:
-                    master_log.append({
-                        "Source": "Custom_Model",
-                        "Label": self.cust_classes[cls_id],
-                        "Conf": float(box.conf[0]),
-                        "Box": box.xyxy[0].tolist()
-                    })
+            with self._locks["custom"]:
+                res_cust = self.model_custom.predict(imgs, conf=0.001, iou=0.5, verbose=False)
+        else:
+            res_cust = [None] * len(imgs)
         
-        # PASS 3: PROCESSING & VISUALIZATION
-        annotated_img = img.copy()
-        csv_data = []
+        return [self._process_results(img, rs, rc) for img, rs, rc in zip(imgs, res_std, res_cust)]
+    
+    def preview_image(self, img):
+        """
+        Fast low-res pass: small model on a downscaled copy.
+        Standard classes only (no custom model: guns and blood stains are
+        not covered), so the UI must label it as partial.
+        Returns (overlay, detections) in original image coordinates.
+        """
+        img_h, img_w = img.shape[:2]
+        scale = min(1.0, self.PREVIEW_MAX_SIDE / max(img_h, img_w))
+        small = cv2.resize(img, (round(img_w * scale), round(img_h * scale)), interpolation=cv2.INTER_AREA)
         
-        for item in master_log:
-            label = item['Label']
-            conf = item['Conf']
-            x1, y1, x2, y2 = map(int, item['Box'])
-            
-            # Clamp coordinates
-            x1 = max(0, x1)
-            y1 = max(0, y1)
-            x2 = min(img_w, x2)
-            y2 = min(img_h, y2)
+        with self._locks["preview"]:
+            if self.model_preview is None:
+                self.model_preview = YOLO(self.preview_weights)
+            res = self.model_preview.predict(small, imgsz=self.PREVIEW_MAX_SIDE, conf=self.VISUAL_CUTOFF,
+                                             iou=0.5, verbose=False)[0]
+        dets = Detections.from_yolo(res, "Preview_Model", self.std_classes, scale=scale).clip(img_w, img_h)
+        
+        overlay = build_overlay(dets, img_w, img_h, self.VISUAL_CUTOFF, self.colors)
+        return overlay, dets
+    
+    def _process_results(self, img, res_std, res_cust):
+        """Turns the raw model results for one image into (overlay, detections)."""
+        img_h, img_w = img.shape[:2]
+        
+        # Both models -> one set of columns (no per-box dicts or strings)
+        dets = Detections.concat([
+            Detections.from_yolo(res_std, "Standard_Model", self.std_classes),
+            Detections.from_yolo(res_cust, "Custom_Model", self.cust_classes)
+        ]).clip(img_w, img_h)
+        
+        # Annotations are kept as a sparse overlay (High Confidence Only),
+        # composited onto the original only when displayed or exported
+        overlay = build_overlay(dets, img_w, img_h, self.VISUAL_CUTOFF, self.colors)
+        
+        return overlay, dets
+
+
+BATCH_SIZE = 8  # Images per batched predict call
+
+# VR textures are written once per content hash and served by Streamlit's
+# static file serving (see .streamlit/config.toml), so the scene HTML only
+# references them by URL
+VR_ASSET_DIR = os.path.join("static", "vr_assets")
+VR_ASSET_URL = "/app/static/vr_assets/"
+# The folder is publicly served and holds case photos: least recently used
+# assets are removed beyond this size (scenes older than that need a rebuild)
+VR_ASSET_MAX_BYTES = 256 * 1024 * 1024
+# Offline A-Frame bundle (static/vendor, see vr_utils.VR_VENDOR_ASSETS). Static
+# serving sends .js as text/plain (nosniff) and the browser would not run it, so
+# the folder is served by a component file server: real content types, and the
+# scripts are cached by the browser instead of being resent with every page
+_VR_VENDOR = components.declare_component("vr_vendor", path=VR_VENDOR_DIR)
+VR_VENDOR_URL = f"/component/{_VR_VENDOR.name}/"
+
+# Background work (depth estimation, full-res refinement) while the
+# main thread runs detection / shows the preview
+_EXECUTOR = ThreadPoolExecutor(max_workers=3)
+
+
+@st.cache_resource
+def get_detector():
+    """Loads the ensemble once per server process instead of once per click."""
+    return EnsembleEvidenceDetector(
+        standard_weights='yolov8l.pt',
+        custom_weights='Custom_Model/weights/best.pt'
+    )
+
+
+@st.cache_resource
+def get_evidence_index():
+    """One shared SQLite evidence index per server process (see evidence_index.py)."""
+    return EvidenceIndex(EVIDENCE_INDEX_PATH)
+
+
+def index_analysis(file_name, img, detections, cutoff, data):
+    """
+    Adds an app analysis (visualized detections) to the evidence index for cross-case queries.
+    The run id is a hash of the upload bytes, so analyzing the same upload again
+    (every click re-runs the script) does not index it twice.
+    """
+    index = get_evidence_index()
+    run_id = f"app-{hashlib.sha1(data).hexdigest()[:16]}"
+    if index.has_run(run_id):
+        return
+    img_h, img_w = img.shape[:2]
+    rows = detections.above(cutoff).to_rows()
+    index.add_image(os.path.splitext(file_name)[0], rows, "app", run_id=run_id,
+                    size=(img_w, img_h), cutoff=cutoff)
+
+
+def build_vr_html(img, image_bytes, detections, depth=None, name="Scene"):
+    """
+    Depth estimation + A-Frame scene for one analyzed image.
+
+    Args:
+        img: BGR image.
+        image_bytes: Encoded original (re-used for the texture if possible).
+        detections: Overlay items (Label, Conf, Box).
+        depth: Optional precomputed estimate_depth() result.
+        name: Scene title in the case gallery.
+    Returns:
+        (html (str), gallery entry (dict))
+    """
+    # Fail before the expensive depth pass if the scene could not render
+    check_vendor_assets()
+    
+    # Original image -> content-addressed asset (upload bytes re-used when possible)
+    img_bytes, img_mime = encode_for_export(img, image_bytes)
+    img_asset = write_asset(img_bytes, ".png" if img_mime == "image/png" else ".jpg", VR_ASSET_DIR,
+                            max_bytes=VR_ASSET_MAX_BYTES)
+    
+    # --- DEPTH ESTIMATION ---
+    if depth is None:
+        # The VR plane only has 128x128 segments, so depth runs at a
+        # reduced working resolution
+        depth = estimate_depth(img, max_side=DEPTH_WORKING_MAX_SIDE)
+    depth_map_pil, depth_array = depth
+    
+    # Depth -> 8-bit displacement map at the mesh resolution
+    depth_asset = write_asset(make_displacement_map(depth_array), ".png", VR_ASSET_DIR,
+                              max_bytes=VR_ASSET_MAX_BYTES)
+    
+    # Generate VR HTML (a few KB, the textures are fetched by URL)
+    img_h, img_w = img.shape[:2]
+    html = create_aframe_scene(detections, img_asset, depth_asset, depth_array, img_w, img_h, None,
+                               asset_base_url=VR_ASSET_URL, vendor_url=VR_VENDOR_URL)
+    entry = make_gallery_entry(name, detections, img_asset, depth_asset, depth_array, img_w, img_h,
+                               vendor_url=VR_VENDOR_URL)
+    return html, entry
+
+
+def render_batch_analysis(uploaded_files):
+    """Multi-image mode: batched analysis, streaming gallery and case summary."""
+    st.markdown(f"""
+        <div class="info-card">
+            <p style="color: #6b7280; margin-bottom: 0;">
+                <strong style="color: #a855f7;">{len(uploaded_files)} images</strong> selected for batch analysis.
+            </p>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    if 'results' not in st.session_state:
+        st.session_state['results'] = SessionResultStore()
+    store = st.session_state['results']
+    
+    gallery = st.container()
+    
+    def show_in_gallery(cols, idx, name, result, img=None):
+        with cols[idx % len(cols)]:
+            if img is None:
+                img = result.image
+            st.image(composite_overlay(img, result.overlay), channels="BGR",
+                     caption=f"{name} ({len(result.overlay['items'])} items)", use_container_width=True)
+    
+    if st.button("🔍 ANALYZE ALL IMAGES", use_container_width=True):
+        detector = get_detector()
+        batch_ids = []
+        skipped = []
+        progress = st.progress(0.0, text="🔄 PROCESSING IMAGES WITH AI MODELS...")
+        cols = gallery.columns(3)
+        
+        # Decode + analyze one chunk at a time, results stream into the gallery
+        for start in range(0, len(uploaded_files), BATCH_SIZE):
+            chunk, chunk_bytes, chunk_imgs = [], [], []
+            for f in uploaded_files[start:start + BATCH_SIZE]:
+                data = f.getvalue()
+                try:
+                    img = decode_image_bytes(data)
+                except ValueError:
+                    # One unreadable file must not cost the rest of the batch
+                    skipped.append(f.name)
+                    st.warning(f"⚠️ SKIPPED {f.name}: not a readable image")
+                    continue
+                chunk.append(f)
+                chunk_bytes.append(data)
+                chunk_imgs.append(img)
             
-            # Add to CSV Data
-            csv_data.append({
-                "Timestamp": datetime.now().isoformat(),
-                "Model_Source": item['Source'],
-                "Evidence_Type": label,
-                "Confidence_Score": conf,
-                "Confidence_Text": f"{conf:.2%}",
-                "Visualized": "YES" if conf > self.VISUAL_CUTOFF else "NO",
-                "Coords": [x1, y1, x2, y2]
-            })
+            if chunk_imgs:
+                for f, data, img, (overlay, dets) in zip(chunk, chunk_bytes, chunk_imgs,
+                                                         detector.analyze_batch(chunk_imgs)):
+                    image_bytes = data if reusable_mime(data) == "image/jpeg" else None
+                    result_id = store.add(img, overlay, dets, detector.VISUAL_CUTOFF, image_bytes=image_bytes)
+                    index_analysis(f.name, img, dets, detector.VISUAL_CUTOFF, data)
+                    batch_ids.append((f.name, result_id))
+                    show_in_gallery(cols, len(batch_ids) - 1, f.name, store.get(result_id), img)
             
-            # Draw Visuals (High Confidence Only)
-            if conf > self.VISUAL_CUTOFF:
-                # Color Selection
-                if "Blood" in label:
-                    c = self.colors["biohazard"]
-                elif "Gun" in label:
-                    c = self.colors["weapon_gun"]
-                elif "Knife" in label:
-                    c = self.colors["weapon_knife"]
-                elif "Person" in label:
-                    c = self.colors["person"]
-                elif "Phone" in label or "Laptop" in label:
-                    c = self.colors["digital"]
-                else:
-                    c = self.colors["general"]
-                
-                # Draw Box
-                cv2.rectangle(annotated_img, (x1, y1), (x2, y2), c, 3)
-                
-                # Label
-                lbl = f"{label} {conf:.0%}"
-                (text_w, text_h), baseline = cv2.getTextSize(lbl, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)
-                
-                # Default: Draw ABOVE the box
-                bg_x1 = x1
-                bg_y1 = y1 - text_h - 10
-                bg_x2 = x1 + text_w + 10
-                bg_y2 = y1
-                text_x = x1 + 5
-                text_y = y1 - 5
-                
-                # Boundary checks
-                if y1 - text_h - 10 < 0:
-                    bg_y1 = y1
-                    bg_y2 = y1 + text_h + 10
-                    text_y = y1 + text_h + 5
-                
-                if x1 + text_w + 10 > img_w:
-                    shift_amount = (x1 + text_w + 10) - img_w
-                    bg_x1 -= shift_amount
-                    bg_x2 -= shift_amount
-                    text_x -= shift_amount
-                
-                # Draw Label Background
-                cv2.rectangle(annotated_img, (bg_x1, bg_y1), (bg_x2, bg_y2), self.colors["bg_label"], -1)
-                
-                # Draw Text
-                cv2.putText(annotated_img, lbl, (text_x, text_y),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, self.colors["text"], 2)
+            done = len(batch_ids) + len(skipped)
+            progress.progress(done / len(uploaded_files),
+                              text=f"🔄 PROCESSED {done}/{len(uploaded_files)} IMAGES")
         
-        return annotated_img, csv_data
+        progress.empty()
+        st.session_state['batch_ids'] = batch_ids
+    elif 'batch_ids' in st.session_state:
+        cols = gallery.columns(3)
+        for idx, (name, result_id) in enumerate(st.session_state['batch_ids']):
+            result = store.get(result_id)
+            if result is not None:
+                show_in_gallery(cols, idx, name, result)
+    
+    if 'batch_ids' not in st.session_state:
+        return
+    
+    results = [(name, store.get(rid)) for name, rid in st.session_state['batch_ids']]
+    evicted = sum(1 for _, r in results if r is None)
+    results = [(name, r) for name, r in results if r is not None]
+    if evicted:
+        st.info(f"ℹ️ {evicted} results were cleared from server memory. Re-run the batch to restore them.")
+    
+    # --- CASE SUMMARY ---
+    st.markdown("""
+        <div class="results-container">
+            <h3 class="result-header">📊 CASE SUMMARY</h3>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    frames = []
+    for name, result in results:
+        df = result.to_dataframe()
+        df.insert(0, "Image", name)
+        frames.append(df)
+    case_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    
+    if case_df.empty:
+        st.info("ℹ️ No evidence detected in these images.")
+        return
+    
+    high_conf_df = case_df[case_df['Visualized'] == 'YES']
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("IMAGES ANALYZED", len(results))
+    with col2:
+        st.metric("TOTAL EVIDENCE", len(high_conf_df), delta="High Confidence")
+    with col3:
+        weapons = int(high_conf_df['Evidence_Type'].str.contains('Gun|Knife', case=False, na=False).sum())
+        st.metric("WEAPONS DETECTED", weapons, delta="⚠️ Critical" if weapons > 0 else "✅ None",
+                  delta_color="inverse" if weapons > 0 else "normal")
+    
+    summary = (high_conf_df.groupby('Evidence_Type')
+               .agg(Count=('Evidence_Type', 'size'), Images=('Image', 'nunique'))
+               .sort_values('Count', ascending=False)
+               .reset_index())
+    summary.columns = ['Evidence Type', 'Count', 'Images']
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+    
+    # --- BUNDLED DOWNLOAD ---
+    # Built on demand so the zip never sits in session state
+    if st.button("📦 PREPARE CASE BUNDLE", use_container_width=True):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("case_report.csv", case_df.to_csv(index=False))
+            for name, result in results:
+                _, jpg = cv2.imencode('.jpg', composite_overlay(result.image, result.overlay))
+                zf.writestr(f"annotated/{os.path.splitext(name)[0]}_ANALYSIS.jpg", jpg.tobytes())
+        st.download_button(
+            label="📥 DOWNLOAD CASE BUNDLE (ZIP)",
+            data=buf.getvalue(),
+            file_name=f"case_bundle_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+            mime="application/zip",
+            use_container_width=True
+        )
 
 
 def main():
@@ -962,6 +1156,16 @@ def main():
             </div>
         """, unsafe_allow_html=True)
         
+        precompute_vr = st.checkbox(
+            "🕶️ Precompute VR scene in background", value=False,
+            help="Run depth estimation during analysis instead of when the VR view is first opened"
+        )
+        quick_preview = st.checkbox(
+            "⚡ Quick preview (low-res first)", value=True,
+            help="Show preliminary boxes from a fast model while the full-resolution ensemble runs "
+                 "(general objects only: guns and blood stains appear with the full result)"
+        )
+        
         st.markdown("---")
         st.markdown("""
             <div style="text-align: center; color: #6b7280; font-size: 0.85rem; line-height: 2;">
@@ -1010,20 +1214,25 @@ def main():
         <div class="info-card">
             <h3 style="color: #a855f7; margin-top: 0; font-family: 'Orbitron', sans-serif; letter-spacing: 2px;">📤 UPLOAD CRIME SCENE IMAGE</h3>
             <p style="color: #6b7280; margin-bottom: 0; line-height: 1.6;">
-                Upload a crime scene photograph for AI-powered evidence detection and analysis.
+                Upload a crime scene photograph for AI-powered evidence detection and analysis,
+                or select several photos of one scene for batch analysis.
                 Supported formats: <strong style="color: #a855f7;">JPG, JPEG, PNG</strong>
             </p>
         </div>
     """, unsafe_allow_html=True)
     
-    uploaded_file = st.file_uploader(
-        "Choose an image file",
+    uploaded_files = st.file_uploader(
+        "Choose image files",
         type=['jpg', 'jpeg', 'png'],
-        help="Upload a crime scene image for analysis",
+        accept_multiple_files=True,
+        help="Upload one crime scene image, or several for batch analysis",
         label_visibility="collapsed"
     )
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
     
-    if uploaded_file is not None:
+    if len(uploaded_files) > 1:
+        render_batch_analysis(uploaded_files)
+    elif uploaded_file is not None:
         # Display original image
         col1, col2 = st.columns([1, 1])
         
@@ -1033,76 +1242,63 @@ def main():
                     <h3 class="result-header">📸 ORIGINAL IMAGE</h3>
                 </div>
             """, unsafe_allow_html=True)
-            image = Image.open(uploaded_file)
+            # Single decode of the upload buffer (EXIF-aware), shared by
+            # detection, depth and export
+            upload_bytes = uploaded_file.getvalue()
+            img_cv2 = decode_image_bytes(upload_bytes)
             st.markdown('<div class="image-container">', unsafe_allow_html=True)
-            st.image(image, use_container_width=True)
+            st.image(img_cv2, channels="BGR", use_container_width=True)
             st.markdown('</div>', unsafe_allow_html=True)
         
         # Process button
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("🔍 ANALYZE EVIDENCE", use_container_width=True):
             with st.spinner("🔄 PROCESSING IMAGE WITH AI MODELS..."):
-                # Convert PIL to CV2
-                img_array = np.array(image)
-                img_cv2 = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+                # Shared detector (models are loaded once per process)
+                detector = get_detector()
                 
-                # Initialize detector
-                detector = EnsembleEvidenceDetector(
-                    standard_weights='yolov8l.pt',
-                    custom_weights='Custom_Model/weights/best.pt'
-                )
+                # Depth only needs the original image, so when VR is
+                # precomputed it runs in parallel with the detection passes
+                if precompute_vr:
+                    depth_future = _EXECUTOR.submit(estimate_depth, img_cv2, max_side=DEPTH_WORKING_MAX_SIDE)
                 
-                # Analyze
-                annotated_img, csv_data = detector.analyze_image(img_cv2)
-                
-                # Convert back to RGB for display
-                annotated_img_rgb = cv2.cvtColor(annotated_img, cv2.COLOR_BGR2RGB)
+                # Analyze (optionally preview first, refine in the background)
+                if quick_preview:
+                    refine = _EXECUTOR.submit(detector.analyze_image, img_cv2)
+                    preview_overlay, _ = detector.preview_image(img_cv2)
+                    preview_slot = col2.empty()
+                    with preview_slot.container():
+                        # The preview model only knows the standard classes: no
+                        # boxes here must not read as "no weapons"
+                        st.info("⚡ PRELIMINARY RESULT - general objects only. Guns and blood stains "
+                                "are not checked until the full analysis finishes.")
+                        st.image(composite_overlay(img_cv2, preview_overlay), channels="BGR",
+                                 caption="⚡ PRELIMINARY (NO GUN / BLOOD CHECK) - refining at full resolution...",
+                                 use_container_width=True)
+                    overlay, dets = refine.result()
+                    preview_slot.empty()
+                else:
+                    overlay, dets = detector.analyze_image(img_cv2)
                 
-                # Store in session state
-                st.session_state['annotated_img'] = annotated_img_rgb
-                st.session_state['csv_data'] = csv_data
+                # Store in session state (compressed frame + sparse overlay + columns)
+                if 'results' not in st.session_state:
+                    st.session_state['results'] = SessionResultStore()
+                store = st.session_state['results']
+                upload_mime = reusable_mime(upload_bytes)
+                result_id = store.add(img_cv2, overlay, dets, detector.VISUAL_CUTOFF,
+                                      image_bytes=upload_bytes if upload_mime == "image/jpeg" else None)
+                st.session_state['result_id'] = result_id
+                st.session_state['result_upload_id'] = uploaded_file.file_id
+                index_analysis(uploaded_file.name, img_cv2, dets, detector.VISUAL_CUTOFF, upload_bytes)
                 
                 # --- VR GENERATION ---
-                # Prepare detections for VR
-                vr_detections = []
-                for item in csv_data:
-                    if item['Visualized'] == 'YES':
-                        vr_detections.append({
-                            'Label': item['Evidence_Type'],
-                            'Conf': item['Confidence_Score'],
-                            'Box': item['Coords']
-                        })
-                
-                # Convert original image to Base64
-                if not os.path.exists("generated_vr"):
-                    os.makedirs("generated_vr")
-                
-                buffered = io.BytesIO()
-                image.save(buffered, format="PNG")
-                img_b64 = base64.b64encode(buffered.getvalue()).decode()
-                img_src = f"data:image/png;base64,{img_b64}"
-                
-                # --- DEPTH ESTIMATION ---
-                st.info("Generating 3D Detail Map (This adds depth)...")
-                depth_map_pil, depth_array = estimate_depth(image)
-                
-                # Convert Depth to Base64
-                buffered_depth = io.BytesIO()
-                depth_map_pil.save(buffered_depth, format="PNG")
-                depth_b64 = base64.b64encode(buffered_depth.getvalue()).decode()
-                depth_src = f"data:image/png;base64,{depth_b64}"
-                # ------------------------
-                
-                # Generate VR HTML
-                img_w, img_h = image.size
-                vr_html_path = "generated_vr/index.html"
-                
-                # Pass depth data
-                create_aframe_scene(vr_detections, img_src, depth_src, depth_array, img_w, img_h, vr_html_path)
-                
-                # Read back the HTML 
-                with open(vr_html_path, 'r', encoding='utf-8') as f:
-                    st.session_state['vr_html'] = f.read()
+                # Only precomputed in the background when asked for,
+                # otherwise built the first time the VR view is opened
+                if precompute_vr:
+                    st.session_state.setdefault('vr_jobs', {})[result_id] = _EXECUTOR.submit(
+                        lambda: build_vr_html(img_cv2, upload_bytes, overlay['items'], depth_future.result(),
+                                              name=uploaded_file.name)
+                    )
                 # ---------------------
                 
                 # Success message
@@ -1113,19 +1309,69 @@ def main():
                 """, unsafe_allow_html=True)
         
         # Display results if available
-        if 'annotated_img' in st.session_state and 'csv_data' in st.session_state:
+        result = None
+        if 'results' in st.session_state and 'result_id' in st.session_state:
+            result = st.session_state['results'].get(st.session_state['result_id'])
+            if result is None:
+                st.info("ℹ️ This analysis was cleared from server memory. Please run the analysis again.")
+        
+        if result is not None:
+            # Re-use the decoded upload when it is the analyzed image
+            if st.session_state.get('result_upload_id') == uploaded_file.file_id:
+                original_img = img_cv2
+            else:
+                original_img = result.image
             with col2:
                 st.markdown("""
                     <div class="results-container">
                         <h3 class="result-header">🎯 ANALYSIS RESULTS</h3>
                     </div>
                 """, unsafe_allow_html=True)
+                
+                # Display filters only redraw the overlay, not the analysis
+                overlay = result.overlay
+                overlay_labels = sorted({item['Label'] for item in overlay['items']})
+                shown_labels = st.multiselect("Show evidence types", overlay_labels, default=overlay_labels)
+                min_conf = st.slider("Display threshold", 0.30, 1.0, 0.30, 0.05)
+                overlay = filter_overlay(overlay, labels=shown_labels, min_conf=min_conf)
+                annotated_img = composite_overlay(original_img, overlay)
+                
                 st.markdown('<div class="image-container">', unsafe_allow_html=True)
-                st.image(st.session_state['annotated_img'], use_container_width=True)
+                st.image(annotated_img, channels="BGR", use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
 
             # --- VR DISPLAY SECTION ---
-            if 'vr_html' in st.session_state:
+            # VR is built lazily and memoized on the stored result
+            result_id = st.session_state['result_id']
+            # Scenes whose textures were evicted from VR_ASSET_DIR get rebuilt
+            st.session_state['results'].drop_missing_vr()
+            vr_html = result.vr_html
+            vr_job = st.session_state.get('vr_jobs', {}).get(result_id)
+            if vr_html is None and vr_job is not None and vr_job.done():
+                del st.session_state['vr_jobs'][result_id]
+                try:
+                    vr_html, vr_entry = vr_job.result()
+                    st.session_state['results'].set_vr_html(result_id, vr_html, vr_entry)
+                except (FileNotFoundError, RuntimeError) as e:  # Offline A-Frame bundle or depth model missing
+                    st.error(f"⚠️ VR MODE UNAVAILABLE: {e}")
+                vr_job = None
+            
+            if vr_html is None:
+                st.markdown("<br>", unsafe_allow_html=True)
+                if st.button("🕶️ ENTER VR MODE (GENERATE 3D SCENE)", use_container_width=True):
+                    with st.spinner("🔄 GENERATING 3D DETAIL MAP..."):
+                        try:
+                            if vr_job is not None:
+                                del st.session_state['vr_jobs'][result_id]
+                                vr_html, vr_entry = vr_job.result()
+                            else:
+                                vr_html, vr_entry = build_vr_html(original_img, result.image_bytes,
+                                                                  result.overlay['items'], name=uploaded_file.name)
+                            st.session_state['results'].set_vr_html(result_id, vr_html, vr_entry)
+                        except (FileNotFoundError, RuntimeError) as e:  # Offline A-Frame bundle or depth model missing
+                            st.error(f"⚠️ VR MODE UNAVAILABLE: {e}")
+            
+            if vr_html:
                 st.markdown("<br>", unsafe_allow_html=True)
                 with st.expander("🕶️ ENTER VR MODE (IMMERSIVE EVIDENCE VIEW)", expanded=True):
                      st.markdown("""
@@ -1139,7 +1385,17 @@ def main():
                             </ul>
                         </div>
                      """, unsafe_allow_html=True)
-                     components.html(st.session_state['vr_html'], height=500, scrolling=False)
+                     components.html(vr_html, height=500, scrolling=False)
+
+            # Case gallery: every scene of this session in one VR page,
+            # each loaded only when navigated to
+            vr_entries = st.session_state['results'].vr_entries()
+            if len(vr_entries) > 1:
+                with st.expander(f"🗂️ CASE VR GALLERY ({len(vr_entries)} SCENES)", expanded=False):
+                    st.caption("Use ← / → (or the arrows in VR) to move between scenes.")
+                    components.html(create_vr_gallery(vr_entries, None, asset_base_url=VR_ASSET_URL,
+                                                      vendor_url=VR_VENDOR_URL),
+                                    height=500, scrolling=False)
             # --------------------------
             
             # Evidence summary
@@ -1153,8 +1409,8 @@ def main():
             # Add spacing between header and metrics
             st.markdown('<div style="margin-top: 1.5rem;"></div>', unsafe_allow_html=True)
             
-            if st.session_state['csv_data']:
-                df = pd.DataFrame(st.session_state['csv_data'])
+            if len(result):
+                df = result.to_dataframe()
                 df = df.sort_values(by="Confidence_Score", ascending=False)
                 
                 # Filter high confidence detections
@@ -1236,18 +1492,18 @@ def main():
                         )
                     
                     with col2:
-                        # Download annotated image using BytesIO
-                        img_pil = Image.fromarray(st.session_state['annotated_img'])
-                        buf = io.BytesIO()
-                        img_pil.save(buf, format='PNG')
-                        buf.seek(0)
-                        st.download_button(
-                            label="🖼️ DOWNLOAD ANNOTATED IMAGE",
-                            data=buf,
-                            file_name=f"annotated_scene_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png",
-                            mime="image/png",
-                            use_container_width=True
-                        )
+                        # Annotated image: composited and encoded only when asked for,
+                        # not on every rerun (filter / slider changes)
+                        if st.button("🖼️ PREPARE ANNOTATED IMAGE", use_container_width=True):
+                            export_img = composite_overlay(original_img, result.overlay)
+                            _, buf = cv2.imencode('.png', export_img)
+                            st.download_button(
+                                label="🖼️ DOWNLOAD ANNOTATED IMAGE",
+                                data=buf.tobytes(),
+                                file_name=f"annotated_scene_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png",
+                                mime="image/png",
+                                use_container_width=True
+                            )
                 else:
                     st.info("ℹ️ No high-confidence evidence detected in this image.")
             else:
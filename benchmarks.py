@@ -0,0 +1,161 @@
+"""
+Micro-benchmarks for the pure-Python parts of the pipeline.
+
+Usage:
+    python benchmarks.py
+"""
+import random
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from vr_utils import LabelGrid, LABEL_HEIGHT, LABEL_MIN_DX
+from detections import Detections
+
+
+def _naive_label_layout(points):
+    """The original create_aframe_scene loop: rescan every label per bump."""
+    placed = []
+    for x, y0 in points:
+        y, k = y0, 0
+        collision = True
+        while collision:
+            collision = False
+            for lx, ly in placed:
+                if abs(x - lx) < LABEL_MIN_DX and abs(y - ly) < LABEL_HEIGHT - LabelGrid.EPS:
+                    collision = True
+                    k += 1
+                    y = y0 + k * LABEL_HEIGHT  # Same slots and tolerance as LabelGrid
+                    break
+        placed.append((x, y))
+    return [y for _, y in placed]
+
+
+def _grid_label_layout(points):
+    grid = LabelGrid()
+    return [grid.place(x, y) for x, y in points]
+
+
+def bench_label_layout(sizes=(100, 500, 1000, 2000, 5000), naive_limit=2000, seed=0):
+    """Label placement on the 12-unit evidence wall, naive scan vs. spatial grid."""
+    print("[BENCH] Label layout (random boxes on a 12 x 6.75 wall)")
+    print(f"{'labels':>8} {'naive (s)':>12} {'grid (s)':>10} {'speedup':>9}")
+    rng = random.Random(seed)
+    for n in sizes:
+        points = [(rng.uniform(-6, 6), rng.uniform(-1.8, 5.0)) for _ in range(n)]
+
+        start = time.perf_counter()
+        grid_ys = _grid_label_layout(points)
+        t_grid = time.perf_counter() - start
+
+        if n <= naive_limit:
+            start = time.perf_counter()
+            naive_ys = _naive_label_layout(points)
+            t_naive = time.perf_counter() - start
+            assert naive_ys == grid_ys, "grid layout differs from the original algorithm"
+            print(f"{n:>8} {t_naive:>12.4f} {t_grid:>10.4f} {t_naive / t_grid:>8.1f}x")
+        else:
+            print(f"{n:>8} {'-':>12} {t_grid:>10.4f} {'-':>9}")
+
+
+class _FakeBox:
+    """One row of ultralytics Boxes (cls/conf/xyxy with a leading axis)."""
+    __slots__ = ("cls", "conf", "xyxy")
+
+    def __init__(self, cls, conf, xyxy):
+        self.cls, self.conf, self.xyxy = cls, conf, xyxy
+
+
+class _FakeBoxes:
+    def __init__(self, n, n_classes, rng):
+        self.cls = rng.integers(0, n_classes, n).astype(np.float32)
+        self.conf = (rng.random(n) ** 4).astype(np.float32)  # Mostly low confidence, like conf=0.001
+        xy = rng.uniform(0, 3800, (n, 2))
+        self.xyxy = np.hstack([xy, xy + rng.uniform(10, 400, (n, 2))]).astype(np.float32)
+
+    def __len__(self):
+        return len(self.cls)
+
+    def __iter__(self):
+        for i in range(len(self.cls)):
+            yield _FakeBox(self.cls[i:i + 1], self.conf[i:i + 1], self.xyxy[i:i + 1])
+
+
+class _FakeResult:
+    def __init__(self, n, n_classes, rng):
+        self.boxes = _FakeBoxes(n, n_classes, rng)
+        self.names = {i: f"class_{i}" for i in range(n_classes)}
+
+
+STD_CLASSES = {0: "Person", 24: "Backpack", 26: "Handbag", 28: "Suitcase", 39: "Bottle", 40: "Wine Glass",
+               41: "Cup", 43: "Knife", 67: "Cell Phone", 76: "Scissors", 73: "Laptop"}
+CUST_CLASSES = {0: "Gun", 1: "Blood Stain"}
+
+
+def _dict_pipeline(res_std, res_cust, img_w, img_h, cutoff):
+    """The original master_log -> csv_data representation (one dict + strings per box)."""
+    master_log = []
+    for res, source, classes in ((res_std, "Standard_Model", STD_CLASSES), (res_cust, "Custom_Model", CUST_CLASSES)):
+        for box in res.boxes:
+            cls_id = int(box.cls[0])
+            if cls_id in classes:
+                master_log.append({"Source": source, "Label": classes[cls_id], "Conf": float(box.conf[0]),
+                                   "Box": box.xyxy[0].tolist()})
+    csv_data = []
+    for item in master_log:
+        conf = item['Conf']
+        x1, y1, x2, y2 = map(int, item['Box'])
+        csv_data.append({
+            "Timestamp": datetime.now().isoformat(),
+            "Model_Source": item['Source'],
+            "Evidence_Type": item['Label'],
+            "Confidence_Score": conf,
+            "Confidence_Text": f"{conf:.2%}",
+            "Visualized": "YES" if conf > cutoff else "NO",
+            "Coords": [max(0, x1), max(0, y1), min(img_w, x2), min(img_h, y2)]
+        })
+    visible = [row for row in csv_data if row["Confidence_Score"] > cutoff]
+    return csv_data, visible
+
+
+def _columnar_pipeline(res_std, res_cust, img_w, img_h, cutoff):
+    dets = Detections.concat([
+        Detections.from_yolo(res_std, "Standard_Model", STD_CLASSES),
+        Detections.from_yolo(res_cust, "Custom_Model", CUST_CLASSES)
+    ]).clip(img_w, img_h)
+    return dets, dets.above(cutoff).items()
+
+
+def _measure(fn, *args, repeat=3):
+    """(best time in s, peak traced bytes, result)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def bench_detections(sizes=(300, 3000, 30000), seed=0):
+    """Per-image detection handling: lists of dicts vs. the columnar Detections container."""
+    print("[BENCH] Detections (parse + fuse + clip + visible items, 2 models)")
+    print(f"{'boxes':>8} {'dicts (ms)':>11} {'cols (ms)':>10} {'speedup':>9} {'dicts peak':>11} {'cols peak':>10}")
+    rng = np.random.default_rng(seed)
+    for n in sizes:
+        res_std, res_cust = _FakeResult(n, 80, rng), _FakeResult(max(1, n // 10), 2, rng)
+        t_dict, m_dict, (rows, visible_rows) = _measure(_dict_pipeline, res_std, res_cust, 4000, 3000, 0.30)
+        t_cols, m_cols, (dets, visible_items) = _measure(_columnar_pipeline, res_std, res_cust, 4000, 3000, 0.30)
+        assert len(rows) == len(dets) and len(visible_rows) == len(visible_items)
+        print(f"{n:>8} {t_dict * 1000:>11.2f} {t_cols * 1000:>10.2f} {t_dict / t_cols:>8.1f}x "
+              f"{m_dict / 1024:>9.0f}KB {m_cols / 1024:>8.0f}KB")
+
+
+if __name__ == "__main__":
+    bench_label_layout()
+    bench_detections()
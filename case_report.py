@@ -0,0 +1,246 @@
+"""
+Case-wide summary of every evidence log under one or more output trees.
+
+Streams the detections once, in chunks, and aggregates them with
+vectorized group-bys into a single JSON artifact: per-image and per-class
+counts, confidence histograms and weapon/blood hotspots.
+
+Sources (per tree, e.g. ensemble_results/ or evidence_reports/):
+    - the Parquet evidence store in '<tree>/evidence_store/' if present
+    - otherwise the legacy per-image CSV files (_FULL_REPORT.csv / _EVIDENCE.csv)
+
+Usage:
+    python case_report.py ensemble_results evidence_reports -o case_summary.json
+"""
+import os
+import glob
+import json
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from evidence_store import LEGACY_SUBDIRS, open_dataset, load_runs
+
+# --- CONFIGURATION ---
+CASE_SUMMARY_FILE = "case_summary.json"
+CHUNK_ROWS = 200_000  # Rows aggregated per step
+HIST_BINS = 20  # Confidence histogram: 0.05 wide bins
+HOTSPOT_CELL = 256  # Hotspot grid cell size (pixels, on the original image)
+HOTSPOT_TOP = 25  # Hotspot cells / images listed per group
+
+# Hotspot group -> substrings of the evidence labels it covers
+HOTSPOT_GROUPS = {
+    "weapon": ("Gun", "Knife", "Scissors"),
+    "blood": ("Blood",),
+}
+
+COLUMNS = ["tool", "image", "evidence_type", "confidence", "x1", "y1", "x2", "y2"]
+COORDS_PATTERN = r"(-?\d+)\D+(-?\d+)\D+(-?\d+)\D+(-?\d+)"
+
+
+def _hotspot_group(labels):
+    """Hotspot group per distinct label (None if the label is not tracked)."""
+    groups = {}
+    for label in labels:
+        groups[label] = next((g for g, keys in HOTSPOT_GROUPS.items() if any(k in label for k in keys)), None)
+    return groups
+
+
+class CaseAggregator:
+    """
+    Running aggregates over detection chunks (DataFrames with COLUMNS).
+
+    Each chunk is reduced with group-bys and only the partial results are
+    kept, so memory grows with the number of images/classes, not rows.
+    """
+
+    def __init__(self, min_conf=None):
+        self.min_conf = min_conf
+        self.rows = 0
+        self._images = []  # (tool, image, evidence_type) -> count
+        self._classes = []  # evidence_type -> count, conf sum, min, max
+        self._hist = []  # (evidence_type, bin) -> count
+        self._hotspots = []  # (group, tool, image, cx, cy) -> count, max conf
+
+    def add(self, df):
+        if self.min_conf is not None:
+            df = df[df["confidence"] >= self.min_conf]
+        if df.empty:
+            return
+        self.rows += len(df)
+        label = df["evidence_type"].astype(str)
+        conf = df["confidence"].astype(np.float32)
+
+        self._images.append(df.groupby([df["tool"].astype(str), df["image"].astype(str), label]).size())
+        self._classes.append(conf.groupby(label).agg(["size", "sum", "min", "max"]))
+
+        bins = np.minimum((conf.to_numpy() * HIST_BINS).astype(np.int64), HIST_BINS - 1)
+        self._hist.append(pd.Series(1, index=df.index).groupby([label, bins]).size())
+
+        group = label.map(_hotspot_group(label.unique()))
+        mask = group.notna().to_numpy()
+        if mask.any():
+            hot = df[mask]
+            cx = (hot["x1"].to_numpy() + hot["x2"].to_numpy()) // 2 // HOTSPOT_CELL
+            cy = (hot["y1"].to_numpy() + hot["y2"].to_numpy()) // 2 // HOTSPOT_CELL
+            keys = [group[mask], hot["tool"].astype(str), hot["image"].astype(str), cx, cy]
+            self._hotspots.append(conf[mask].groupby(keys).agg(["size", "max"]))
+
+    def summary(self):
+        """Combines the partial aggregates into the JSON-ready summary."""
+        if not self.rows:
+            return {"rows": 0, "images": 0, "classes": [], "histogram": {}, "per_image": [], "hotspots": {}}
+
+        per_image = pd.concat(self._images).groupby(level=[0, 1, 2]).sum()
+        totals = per_image.groupby(level=[0, 1]).sum().sort_values(ascending=False, kind="stable")
+        counts = {}
+        for (tool, image, label), n in zip(per_image.index, per_image.to_numpy().tolist()):
+            counts.setdefault((tool, image), {})[label] = n
+
+        stats = pd.concat(self._classes).groupby(level=0).agg({"size": "sum", "sum": "sum", "min": "min", "max": "max"})
+        images_per_class = per_image.groupby(level=2).size()
+        classes = [{
+            "evidence_type": label,
+            "detections": int(row["size"]),
+            "images": int(images_per_class.get(label, 0)),
+            "mean_conf": round(float(row["sum"] / row["size"]), 4),
+            "min_conf": round(float(row["min"]), 4),
+            "max_conf": round(float(row["max"]), 4),
+        } for label, row in stats.sort_values("size", ascending=False).iterrows()]
+
+        hist = pd.concat(self._hist).groupby(level=[0, 1]).sum().unstack(fill_value=0)
+        hist = hist.reindex(columns=range(HIST_BINS), fill_value=0)
+
+        hotspots = {}
+        if self._hotspots:
+            cells = pd.concat(self._hotspots).groupby(level=[0, 1, 2, 3, 4]).agg({"size": "sum", "max": "max"})
+            for group, g in cells.groupby(level=0):
+                top = g.sort_values(["size", "max"], ascending=False).head(HOTSPOT_TOP)
+                per_img = g["size"].groupby(level=[1, 2]).sum().sort_values(ascending=False).head(HOTSPOT_TOP)
+                hotspots[group] = {
+                    "detections": int(g["size"].sum()),
+                    "images": int(g.groupby(level=[1, 2]).ngroups),
+                    "cells": [{
+                        "tool": tool, "image": image, "detections": int(row["size"]),
+                        "max_conf": round(float(row["max"]), 4),
+                        "box": [int(cx) * HOTSPOT_CELL, int(cy) * HOTSPOT_CELL,
+                                (int(cx) + 1) * HOTSPOT_CELL, (int(cy) + 1) * HOTSPOT_CELL]
+                    } for (_, tool, image, cx, cy), row in top.iterrows()],
+                    "top_images": [{"tool": tool, "image": image, "detections": int(n)}
+                                   for (tool, image), n in per_img.items()],
+                }
+
+        return {
+            "rows": int(self.rows),
+            "images": int(len(totals)),
+            "classes": classes,
+            "histogram": {
+                "bins": [round(i / HIST_BINS, 4) for i in range(HIST_BINS + 1)],
+                "counts": {label: [int(v) for v in row] for label, row in hist.iterrows()},
+            },
+            "per_image": [{"tool": tool, "image": image, "total": total, "counts": counts[(tool, image)]}
+                          for (tool, image), total in zip(totals.index, totals.to_numpy().tolist())],
+            "hotspots": hotspots,
+        }
+
+
+def _store_chunks(store_root, chunk_rows):
+    """
+    Batches of the official rows of a Parquet evidence store: above the
+    cutoff and on the tool's evidence list (the rows the legacy
+    _FULL_REPORT.csv / _EVIDENCE.csv files hold).
+    """
+    dataset = open_dataset(store_root)
+    columns = COLUMNS + ["above_cutoff", "evidence_class"]
+    for batch in dataset.to_batches(columns=columns, batch_size=chunk_rows):
+        if batch.num_rows:
+            df = batch.to_pandas()
+            yield df[df["above_cutoff"] & df["evidence_class"]]
+
+
+def _read_legacy_csv(path):
+    """One legacy per-image CSV -> COLUMNS (visualized / official rows only)."""
+    if path.endswith("_FULL_REPORT.csv"):
+        df = pd.read_csv(path, dtype={"Image": str})
+        df = df[df["Visualized"] == "YES"]
+        tool, image, conf, coords = "ensemble", df["Image"], df["Confidence_Score"], df["Coords"]
+    else:
+        df = pd.read_csv(path, dtype={"Source_Image": str})
+        tool, image, coords = "yolo_marked", df["Source_Image"], df["Location"]
+        conf = df["Confidence"].str.rstrip("%").astype(float) / 100
+    box = coords.str.extract(COORDS_PATTERN).astype(np.int32)
+    return pd.DataFrame({"tool": tool, "image": image, "evidence_type": df["Evidence_Type"],
+                         "confidence": conf.astype(np.float32),
+                         "x1": box[0], "y1": box[1], "x2": box[2], "y2": box[3]})
+
+
+def _legacy_chunks(tree, chunk_rows):
+    """Legacy CSVs of a tree, concatenated into chunks of ~chunk_rows rows."""
+    patterns = [os.path.join(tree, LEGACY_SUBDIRS[s], f"*{s}") for s in ("_FULL_REPORT.csv", "_EVIDENCE.csv")]
+    buffer, buffered = [], 0
+    for path in sorted(p for pattern in patterns for p in glob.glob(pattern)):
+        df = _read_legacy_csv(path)
+        buffer.append(df)
+        buffered += len(df)
+        if buffered >= chunk_rows:
+            yield pd.concat(buffer, ignore_index=True)
+            buffer, buffered = [], 0
+    if buffer:
+        yield pd.concat(buffer, ignore_index=True)
+
+
+def _has_store(store_root):
+    return bool(glob.glob(os.path.join(store_root, "tool=*", "run=*", "part-*.parquet")))
+
+
+def build_case_report(trees, output_file=CASE_SUMMARY_FILE, min_conf=None, chunk_rows=CHUNK_ROWS):
+    """
+    Aggregates every tree and writes the summary JSON. Returns the summary.
+
+    A tree's evidence store takes precedence over its CSV files (exported
+    CSVs would otherwise be counted twice).
+    """
+    start = datetime.now()
+    agg = CaseAggregator(min_conf=min_conf)
+    sources = []
+    for tree in trees:
+        store_root = tree if os.path.basename(os.path.normpath(tree)) == "evidence_store" \
+            else os.path.join(tree, "evidence_store")
+        if _has_store(store_root):
+            chunks = _store_chunks(store_root, chunk_rows)
+            sources.append({"path": store_root, "kind": "parquet", "runs": len(load_runs(store_root))})
+        else:
+            chunks = _legacy_chunks(tree, chunk_rows)
+            sources.append({"path": tree, "kind": "csv"})
+        for chunk in chunks:
+            agg.add(chunk)
+
+    summary = {"generated": datetime.now().isoformat(), "sources": sources, "min_conf": min_conf,
+               "hotspot_cell": HOTSPOT_CELL, **agg.summary()}
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+
+    elapsed = (datetime.now() - start).total_seconds()
+    print(f"[CASE] {summary['rows']} detections in {summary['images']} images "
+          f"from {len(sources)} sources in {elapsed:.2f}s -> '{output_file}'")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Case-wide evidence summary")
+    parser.add_argument("trees", nargs="+", help="Output trees, e.g. ensemble_results evidence_reports")
+    parser.add_argument("-o", "--output", default=CASE_SUMMARY_FILE)
+    parser.add_argument("--min-conf", type=float)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    report = build_case_report(args.trees, args.output, args.min_conf, args.chunk_rows)
+    for c in report["classes"]:
+        print(f"  {c['evidence_type']:<26} {c['detections']:>7} detections  {c['images']:>6} images  "
+              f"mean {c['mean_conf']:.2f}")
+    for group, h in report["hotspots"].items():
+        print(f"  [{group.upper()}] {h['detections']} detections in {h['images']} images")
@@ -0,0 +1,139 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURATION ---
+DEBUG_RECORDS_FILE = "_debug.bin"  # '_' prefix: skipped by Parquet dataset scans
+DEBUG_META_FILE = "_debug.json"
+
+# One packed 17-byte record per raw detection (conf=0.001 stream)
+DEBUG_DTYPE = np.dtype([
+    ("image", "<u4"),  # Index into the image list
+    ("source", "u1"),  # Index into the model source list
+    ("cls", "u1"),  # Index into the (object_type, evidence_type) class list
+    ("flags", "u1"),  # FLAG_EVIDENCE_CLASS | FLAG_ABOVE_CUTOFF
+    ("conf", "<f2"),
+    ("box", "<i2", (4,)),  # x1, y1, x2, y2 in pixels
+])
+FLAG_EVIDENCE_CLASS = 1
+FLAG_ABOVE_CUTOFF = 2
+BOX_MAX = np.iinfo(np.int16).max
+
+
+class DebugLogWriter:
+    """
+    Appends the raw detections of a run to one binary file of DEBUG_DTYPE
+    records (no per-row timestamps or formatted strings). Names are kept
+    once in a JSON sidecar written on close().
+    """
+
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        os.makedirs(run_dir, exist_ok=True)
+        self._file = open(os.path.join(run_dir, DEBUG_RECORDS_FILE), "wb")
+        self.images = []  # [name, iso timestamp]
+        self._sources = {}
+        self._classes = {}
+        self.n_records = 0
+
+    def _codes(self, table, keys, limit=255):
+        """Codes of keys in the run-wide vocabulary (extended as needed)."""
+        codes = []
+        for key in keys:
+            code = table.get(key)
+            if code is None:
+                code = len(table)
+                if code > limit:
+                    raise ValueError(f"Debug log supports at most {limit + 1} distinct values, got {key!r}")
+                table[key] = code
+            codes.append(code)
+        return np.array(codes, dtype=np.uint8)
+
+    def append(self, image, detections, timestamp, above):
+        """
+        Adds one image's Detections.
+
+        above: bool per row, conf above the tool's cutoff.
+        """
+        image_idx = len(self.images)
+        self.images.append([image, timestamp.isoformat()])
+        if not len(detections):
+            return
+        records = np.empty(len(detections), dtype=DEBUG_DTYPE)
+        records["image"] = image_idx
+        records["source"] = self._codes(self._sources, detections.sources)[detections.source_ids]
+        records["cls"] = self._codes(self._classes, detections.classes)[detections.cls]
+        records["flags"] = (np.where(detections.evidence_class, FLAG_EVIDENCE_CLASS, 0)
+                            | np.where(above, FLAG_ABOVE_CUTOFF, 0))
+        records["conf"] = detections.conf
+        records["box"] = np.clip(detections.boxes, 0, BOX_MAX)
+        self._file.write(records.tobytes())
+        self.n_records += len(records)
+
+    def close(self):
+        self._file.close()
+        meta = {
+            "dtype": DEBUG_DTYPE.descr,
+            "records": self.n_records,
+            "images": self.images,
+            "sources": list(self._sources),
+            "classes": [list(c) for c in self._classes],
+        }
+        with open(os.path.join(self.run_dir, DEBUG_META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+
+def has_debug_log(run_dir):
+    return os.path.exists(os.path.join(run_dir, DEBUG_META_FILE))
+
+
+class DebugLog:
+    """
+    Memory-mapped reader for a run's debug log.
+
+    `records` is the raw structured array (nothing is decoded); use
+    for_image() / to_dataframe() when names or a table are needed.
+    """
+
+    def __init__(self, run_dir):
+        with open(os.path.join(run_dir, DEBUG_META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.images = [name for name, _ in meta["images"]]
+        self.timestamps = [ts for _, ts in meta["images"]]
+        self.sources = meta["sources"]
+        self.classes = [tuple(c) for c in meta["classes"]]
+        if meta["records"]:
+            self.records = np.memmap(os.path.join(run_dir, DEBUG_RECORDS_FILE), dtype=DEBUG_DTYPE,
+                                     mode="r", shape=(meta["records"],))
+        else:
+            self.records = np.empty(0, dtype=DEBUG_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def for_image(self, image):
+        """Records of one image (a view, still undecoded)."""
+        return self.records[self.records["image"] == self.images.index(image)]
+
+    def to_dataframe(self, records=None):
+        """Decodes records (default: all) into the evidence store column layout."""
+        rec = self.records if records is None else records
+        classes = self.classes or [("", "")]
+        boxes = np.asarray(rec["box"], dtype=np.int32)
+        flags = np.asarray(rec["flags"])
+        cls = np.asarray(rec["cls"])
+        image_idx = np.asarray(rec["image"])
+        sources = np.array(self.sources or [""], dtype=object)
+        return pd.DataFrame({
+            "timestamp": pd.to_datetime(np.array(self.timestamps, dtype=object)[image_idx]),
+            "image": np.array(self.images, dtype=object)[image_idx],
+            "model_source": sources[np.asarray(rec["source"])],
+            "object_type": np.array([c[0] for c in classes], dtype=object)[cls],
+            "evidence_type": np.array([c[1] for c in classes], dtype=object)[cls],
+            "confidence": np.asarray(rec["conf"], dtype=np.float32),
+            "evidence_class": (flags & FLAG_EVIDENCE_CLASS) > 0,
+            "above_cutoff": (flags & FLAG_ABOVE_CUTOFF) > 0,
+            "x1": boxes[:, 0], "y1": boxes[:, 1], "x2": boxes[:, 2], "y2": boxes[:, 3],
+        })
@@ -0,0 +1,194 @@
+"""
+Perceptual-hash de-duplication of scene images.
+
+Burst shots and re-saved copies of the same photo hash to (nearly) the
+same 64-bit value. Hashes are kept in a multi-index hash table, so finding
+every earlier image within a Hamming distance only checks a few candidates
+instead of scanning all of them.
+
+Usage (report only):
+    python dedupe.py "crime_scenes/*" --max-distance 3 -o dedupe_report.json
+"""
+import json
+import argparse
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from image_io import iter_images, read_image
+
+# --- CONFIGURATION ---
+DEDUPE_MAX_DISTANCE = 3  # Hamming distance (of 64 bits) still counted as the same photo
+HASH_DECODE_SIDE = 256  # Reduced decode for hashing from a file
+MIN_HASH_BITS = 4  # Hashes with fewer set (or unset) bits come from flat images and never match
+
+
+def dhash(img):
+    """64-bit difference hash of a BGR or grayscale image."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).reshape(-1)
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def phash(img):
+    """64-bit DCT hash (more robust to re-compression and small edits, slower)."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].reshape(-1)
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+HASHES = {"dhash": dhash, "phash": phash}
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class HashIndex:
+    """
+    Multi-index hash table over 64-bit hashes.
+
+    The hash is split into max_distance + 1 chunks; two hashes within
+    max_distance bits must agree exactly on at least one chunk (pigeonhole),
+    so a search only verifies the items sharing a chunk with the query.
+    """
+
+    def __init__(self, max_distance=DEDUPE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        n = max_distance + 1
+        edges = [round(i * 64 / n) for i in range(n + 1)]
+        self._chunks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._tables = [{} for _ in self._chunks]
+        self._items = []  # (hash, item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, value, item):
+        idx = len(self._items)
+        self._items.append((value, item))
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((value >> shift) & mask, []).append(idx)
+
+    def search(self, value):
+        """[(distance, item)] within max_distance, closest first (ties: oldest first)."""
+        candidates = set()
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            candidates.update(table.get((value >> shift) & mask, ()))
+        found = []
+        for idx in sorted(candidates):
+            h, item = self._items[idx]
+            d = hamming(value, h)
+            if d <= self.max_distance:
+                found.append((d, item))
+        return sorted(found, key=lambda f: f[0])
+
+
+class Deduplicator:
+    """
+    Online near-duplicate detection for a batch run.
+
+    check() returns the earlier image a new one duplicates (or None and
+    registers it as a new cluster representative). With reuse=True the
+    caller keeps each representative's results in `results` and reuses
+    them for its duplicates; otherwise duplicates are skipped.
+
+    Usage:
+        dedupe = Deduplicator(reuse=True)
+        original = dedupe.check(name, img)
+        if original is None:
+            ... analyze, dedupe.results[name] = ..., dedupe.record_time(seconds) ...
+    """
+
+    def __init__(self, max_distance=DEDUPE_MAX_DISTANCE, method="dhash", reuse=False):
+        self.max_distance = max_distance
+        self.method = method
+        self.reuse = reuse
+        self.results = {}  # representative -> caller's results (reuse=True)
+        self._hash = HASHES[method]
+        self._index = HashIndex(max_distance)
+        self.clusters = {}  # representative -> [duplicates]
+        self.distances = {}  # duplicate -> distance to its representative
+        self._analysis_s = []
+
+    def check(self, name, img):
+        value = self._hash(img)
+        # Flat/low-detail frames (dark, overexposed, blank) all hash alike
+        bits = value.bit_count()
+        if bits < MIN_HASH_BITS or bits > 64 - MIN_HASH_BITS:
+            self.clusters[name] = []
+            return None
+        matches = self._index.search(value)
+        if matches:
+            distance, original = matches[0]
+            self.clusters[original].append(name)
+            self.distances[name] = distance
+            return original
+        self._index.add(value, name)
+        self.clusters[name] = []
+        return None
+
+    def record_time(self, seconds):
+        """Analysis time of one non-duplicate image (for the compute-saved estimate)."""
+        self._analysis_s.append(seconds)
+
+    def report(self):
+        duplicates = sum(len(d) for d in self.clusters.values())
+        mean_s = float(np.mean(self._analysis_s)) if self._analysis_s else 0.0
+        return {
+            "mode": "reuse" if self.reuse else "skip",
+            "method": self.method,
+            "max_distance": self.max_distance,
+            "images": len(self.clusters) + duplicates,
+            "unique": len(self.clusters),
+            "duplicates": duplicates,
+            "estimated_saved_s": round(mean_s * duplicates, 2),
+            "clusters": [{"representative": rep, "duplicates": [{"image": d, "distance": self.distances[d]}
+                                                                 for d in dups]}
+                         for rep, dups in self.clusters.items() if dups],
+        }
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=1)
+
+    def summary_line(self):
+        r = self.report()
+        return (f"[DEDUPE] {r['duplicates']} near-duplicates of {r['images']} images in "
+                f"{len(r['clusters'])} clusters (~{r['estimated_saved_s']:.1f}s of analysis saved)")
+
+
+def find_duplicates(source, max_distance=DEDUPE_MAX_DISTANCE, method="dhash"):
+    """Stand-alone pre-pass over a folder/glob. Returns the Deduplicator."""
+    dedupe = Deduplicator(max_distance, method)
+    for path in iter_images(source):
+        img, _, _ = read_image(path, HASH_DECODE_SIDE)
+        if img is not None:
+            dedupe.check(path, img)
+    return dedupe
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find near-duplicate scene images")
+    parser.add_argument("source", help='Folder or glob, e.g. "crime_scenes/*"')
+    parser.add_argument("--max-distance", type=int, default=DEDUPE_MAX_DISTANCE)
+    parser.add_argument("--method", default="dhash", choices=sorted(HASHES))
+    parser.add_argument("-o", "--output", help="Write the cluster report to this JSON file")
+    args = parser.parse_args()
+
+    start = datetime.now()
+    result = find_duplicates(args.source, args.max_distance, args.method)
+    report = result.report()
+    for cluster in report["clusters"]:
+        print(f"{cluster['representative']}")
+        for dup in cluster["duplicates"]:
+            print(f"   = {dup['image']} (distance {dup['distance']})")
+    if args.output:
+        result.save(args.output)
+    elapsed = (datetime.now() - start).total_seconds()
+    print(f"[DEDUPE] {report['duplicates']} near-duplicates of {report['images']} images "
+          f"in {len(report['clusters'])} clusters ({elapsed:.2f}s)")
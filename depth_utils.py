@@ -1,39 +1,340 @@
-
+import os
+import time
+import threading
+import hashlib
+import cv2
 import torch
-from transformers import pipeline
+from transformers import pipeline, AutoModelForDepthEstimation, AutoImageProcessor
 from PIL import Image
 import numpy as np
 
-# Global cache for the pipeline to avoid reloading
-_DEPTH_PIPE = None
+DEPTH_MODEL_ID = "LiheYoung/depth-anything-small-hf"
+FALLBACK_MODEL_ID = "Intel/dpt-large"
+
+# Local copy of the model (e.g. `huggingface-cli download LiheYoung/depth-anything-small-hf
+# --local-dir models/depth-anything-small-hf`), used without network access
+DEPTH_MODEL_DIR = os.path.join("models", "depth-anything-small-hf")
+# Cached ONNX export, kept outside DEPTH_MODEL_DIR so a failed export never
+# leaves a model directory without config.json behind
+DEPTH_ONNX_PATH = os.path.join("models", "onnx", "depth-anything-small-hf.onnx")
+
+# Backends tried in order. "onnx" needs onnxruntime (and onnx for the
+# one-time export, both in requirements.txt), "hf-pipeline" is the plain
+# transformers pipeline.
+DEPTH_BACKENDS = ["onnx", "hf-pipeline"]
+# Download from the Hugging Face hub if the model is not available locally
+DEPTH_ALLOW_DOWNLOAD = False
+# Intel/dpt-large is several times slower, never use it unless asked to
+DEPTH_ALLOW_SLOW_FALLBACK = False
+
+# Disk cache for depth maps (keyed by image content + model)
+DEPTH_CACHE_DIR = "depth_cache"
+DEPTH_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Working resolution for depth inference (longest side, pixels).
+# Depth Anything resizes to 518 internally, so larger inputs only cost
+# pre/post-processing time and memory.
+DEPTH_WORKING_MAX_SIDE = 518
+
+# Global cache for the backend to avoid reloading
+_DEPTH_BACKEND = None
+_DEPTH_BACKEND_LOCK = threading.Lock()
+
+
+def _model_source(model_id):
+    """Returns (path_or_id, local_files_only) for loading a model without surprises."""
+    if model_id == DEPTH_MODEL_ID and os.path.isfile(os.path.join(DEPTH_MODEL_DIR, "config.json")):
+        return DEPTH_MODEL_DIR, True
+    return model_id, not DEPTH_ALLOW_DOWNLOAD
+
+
+class HFPipelineBackend:
+    """Depth through transformers.pipeline (PyTorch eager)."""
+    name = "hf-pipeline"
+
+    def __init__(self, model_id=DEPTH_MODEL_ID):
+        self.model_id = model_id
+        source, local_only = _model_source(model_id)
+        model = AutoModelForDepthEstimation.from_pretrained(source, local_files_only=local_only)
+        processor = AutoImageProcessor.from_pretrained(source, local_files_only=local_only)
+        self.pipe = pipeline(task="depth-estimation", model=model, image_processor=processor)
+
+    def __call__(self, image):
+        return self.batch([image])[0]
+
+    def batch(self, images):
+        # pipeline returns a dict with 'depth' (PIL Image, uint8) per image
+        results = self.pipe(images, batch_size=len(images))
+        return [np.array(r["depth"]) for r in results]
+
+
+class OnnxBackend:
+    """
+    Depth Anything exported to ONNX and run with onnxruntime on CPU.
+
+    The export is done once from the local model directory and cached at
+    DEPTH_ONNX_PATH. Pre/post-processing matches the transformers
+    pipeline (518px, multiple of 14, ImageNet normalization, output
+    rescaled to 0-255).
+    """
+    name = "onnx"
+    INPUT_SIZE = 518
+    MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+    def __init__(self, model_id=DEPTH_MODEL_ID, onnx_path=DEPTH_ONNX_PATH):
+        import onnxruntime as ort
+
+        self.model_id = model_id
+        if not os.path.exists(onnx_path):
+            self._export(model_id, onnx_path)
+        self.session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    @staticmethod
+    def _export(model_id, onnx_path):
+        source, local_only = _model_source(model_id)
+        print(f"[DEPTH] Exporting {model_id} to ONNX ({onnx_path})...")
+        model = AutoModelForDepthEstimation.from_pretrained(source, local_files_only=local_only).eval()
+        os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+        dummy = torch.zeros(1, 3, OnnxBackend.INPUT_SIZE, OnnxBackend.INPUT_SIZE)
+        tmp_path = onnx_path + ".tmp"
+        try:
+            with torch.no_grad():
+                torch.onnx.export(
+                    model, (dummy,), tmp_path,
+                    input_names=["pixel_values"], output_names=["predicted_depth"],
+                    dynamic_axes={"pixel_values": {0: "batch", 2: "height", 3: "width"},
+                                  "predicted_depth": {0: "batch", 1: "height", 2: "width"}},
+                    opset_version=17
+                )
+            os.replace(tmp_path, onnx_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _input_size(self, h, w):
+        # Same as DPT's keep_aspect_ratio resize: scale as little as possible,
+        # then round to a multiple of 14 (the ViT patch size)
+        scale_h = self.INPUT_SIZE / h
+        scale_w = self.INPUT_SIZE / w
+        if abs(1 - scale_w) < abs(1 - scale_h):
+            scale_h = scale_w
+        else:
+            scale_w = scale_h
+        new_h = max(14, int(round(h * scale_h / 14) * 14))
+        new_w = max(14, int(round(w * scale_w / 14) * 14))
+        return new_h, new_w
+
+    def __call__(self, image):
+        return self.batch([image])[0]
+
+    def batch(self, images):
+        # Images with the same network input size are stacked into one run
+        groups = {}
+        for i, image in enumerate(images):
+            rgb = np.asarray(image.convert("RGB"))
+            h, w = rgb.shape[:2]
+            in_h, in_w = self._input_size(h, w)
+            x = cv2.resize(rgb, (in_w, in_h), interpolation=cv2.INTER_CUBIC).astype(np.float32) / 255.0
+            x = ((x - self.MEAN) / self.STD).transpose(2, 0, 1)
+            groups.setdefault((in_h, in_w), []).append((i, (w, h), x))
+
+        outputs = [None] * len(images)
+        for items in groups.values():
+            preds = self.session.run(None, {self.input_name: np.stack([x for _, _, x in items])})[0]
+            for (i, size, _), pred in zip(items, preds):
+                pred = cv2.resize(pred, size, interpolation=cv2.INTER_CUBIC)
+                outputs[i] = (pred * 255 / np.max(pred)).astype(np.uint8)
+        return outputs
+
+
+_BACKEND_TYPES = {"onnx": OnnxBackend, "hf-pipeline": HFPipelineBackend}
 
-def get_depth_pipeline():
-    global _DEPTH_PIPE
-    if _DEPTH_PIPE is None:
+
+def get_depth_backend():
+    """
+    Loads the first working backend from DEPTH_BACKENDS (cached).
+
+    Every backend runs Depth Anything Small. The much slower
+    Intel/dpt-large is only used if DEPTH_ALLOW_SLOW_FALLBACK is set,
+    otherwise a RuntimeError lists why each backend failed.
+    Thread-safe: concurrent callers wait for a single load (and a single
+    ONNX export).
+    """
+    global _DEPTH_BACKEND
+    if _DEPTH_BACKEND is not None:
+        return _DEPTH_BACKEND
+
+    with _DEPTH_BACKEND_LOCK:
+        if _DEPTH_BACKEND is not None:  # Loaded while waiting for the lock
+            return _DEPTH_BACKEND
+
+        errors = []
+        for name in DEPTH_BACKENDS:
+            start = time.perf_counter()
+            try:
+                backend = _BACKEND_TYPES[name]()
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+                print(f"[DEPTH] Backend '{name}' unavailable: {e}")
+                continue
+            print(f"[DEPTH] Loaded backend '{name}' ({backend.model_id}) in {time.perf_counter() - start:.2f}s")
+            _DEPTH_BACKEND = backend
+            return backend
+
+        if DEPTH_ALLOW_SLOW_FALLBACK:
+            print(f"[WARNING] Falling back to {FALLBACK_MODEL_ID}, expect much slower depth estimation.")
+            start = time.perf_counter()
+            _DEPTH_BACKEND = HFPipelineBackend(FALLBACK_MODEL_ID)
+            print(f"[DEPTH] Loaded fallback backend in {time.perf_counter() - start:.2f}s")
+            return _DEPTH_BACKEND
+
+        raise RuntimeError(
+            f"No depth backend could load {DEPTH_MODEL_ID} ({'; '.join(errors)}). "
+            f"Download it to '{DEPTH_MODEL_DIR}', set DEPTH_ALLOW_DOWNLOAD = True, "
+            f"or set DEPTH_ALLOW_SLOW_FALLBACK = True to use {FALLBACK_MODEL_ID}."
+        )
+
+def _cache_key(rgb_array, max_side=None):
+    """Content hash of the RGB pixels + the depth model (and resolution) that produced the map."""
+    model_id = _DEPTH_BACKEND.model_id if _DEPTH_BACKEND is not None else DEPTH_MODEL_ID
+    h = hashlib.blake2b(digest_size=20)
+    h.update(model_id.encode())
+    h.update(str(max_side).encode())
+    h.update(str(rgb_array.shape).encode())
+    h.update(np.ascontiguousarray(rgb_array).data)
+    return h.hexdigest()
+
+def _cache_load(key):
+    path = os.path.join(DEPTH_CACHE_DIR, f"{key}.npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            depth_array = data["depth"]
+    except Exception as e:
+        print(f"[WARNING] Dropping unreadable depth cache entry {path}: {e}")
+        os.remove(path)
+        return None
+    # Touch so eviction is least-recently-used
+    os.utime(path)
+    return depth_array
+
+def _cache_store(key, depth_array):
+    os.makedirs(DEPTH_CACHE_DIR, exist_ok=True)
+    path = os.path.join(DEPTH_CACHE_DIR, f"{key}.npz")
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, depth=depth_array)
+    os.replace(tmp_path, path)
+    _cache_evict()
+
+def _cache_evict():
+    """Removes least recently used entries until the cache fits DEPTH_CACHE_MAX_BYTES."""
+    entries = []
+    for name in os.listdir(DEPTH_CACHE_DIR):
+        if not name.endswith(".npz") or ".tmp" in name:
+            continue
+        path = os.path.join(DEPTH_CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(e[1] for e in entries)
+    for _, size, path in sorted(entries):
+        if total <= DEPTH_CACHE_MAX_BYTES:
+            break
         try:
-            # Using Depth Anything Small for speed/performance balance
-            # If this fails, we can fall back to DPT
-            _DEPTH_PIPE = pipeline(task="depth-estimation", model="LiheYoung/depth-anything-small-hf")
-        except Exception as e:
-            print(f"Error loading Depth Anything: {e}. Falling back to Intel/dpt-large.")
-            _DEPTH_PIPE = pipeline(task="depth-estimation", model="Intel/dpt-large")
-    return _DEPTH_PIPE
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
 
-def estimate_depth(image):
+def upsample_depth(depth_array, width, height):
+    """Resizes a (working resolution) depth map to width x height for consumers that need full size."""
+    if depth_array.shape[:2] == (height, width):
+        return depth_array
+    return cv2.resize(depth_array, (width, height), interpolation=cv2.INTER_LINEAR)
+
+def estimate_depth(image, use_cache=True, max_side=None):
     """
-    Estimates depth from a PIL Image.
+    Estimates depth from a PIL Image or a BGR numpy array (OpenCV).
+    Results are cached on disk (DEPTH_CACHE_DIR) by image content.
+
+    Args:
+        max_side: Optional working resolution. The image is downscaled so its
+            longest side is at most max_side, and the depth map is returned at
+            that size (see upsample_depth() to get back to full size).
     Returns:
         depth_map (PIL.Image): Grayscale depth map.
         depth_array (np.array): Raw depth values.
     """
-    pipe = get_depth_pipeline()
-    
-    # Inference
-    # pipeline returns a dict with 'depth' (PIL Image)
-    result = pipe(image)
-    depth_map = result["depth"]
-    
-    # Convert to numpy for advanced usage if needed
-    depth_array = np.array(depth_map)
-    
-    return depth_map, depth_array
+    return estimate_depth_batch([image], use_cache=use_cache, max_side=max_side)[0]
+
+def estimate_depth_batch(images, use_cache=True, max_side=None, batch_size=4):
+    """
+    Batched estimate_depth(). Cache hits are returned directly, the misses
+    go through the depth backend batch_size images at a time.
+    Returns:
+        List of (depth_map, depth_array), one per input image.
+    """
+    rgb_arrays = []
+    for image in images:
+        if isinstance(image, np.ndarray):
+            # BGR -> RGB view, PIL makes the single copy it needs
+            rgb_arrays.append(image[:, :, ::-1])
+        else:
+            rgb_arrays.append(np.asarray(image.convert("RGB")))
+
+    results = [None] * len(images)
+    key_model = _DEPTH_BACKEND.model_id if _DEPTH_BACKEND is not None else DEPTH_MODEL_ID
+    keys = [_cache_key(rgb, max_side) if use_cache else None for rgb in rgb_arrays]
+    for i, key in enumerate(keys):
+        if key is not None:
+            depth_array = _cache_load(key)
+            if depth_array is not None:
+                results[i] = (Image.fromarray(depth_array), depth_array)
+
+    pending = [i for i, r in enumerate(results) if r is None]
+    if not pending:
+        return results
+
+    backend = get_depth_backend()
+    if use_cache and backend.model_id != key_model:
+        # Loading the backend fell back to another model
+        keys = [_cache_key(rgb, max_side) for rgb in rgb_arrays]
+
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        inputs = []
+        full_bytes = 0
+        for i in chunk:
+            rgb_array = rgb_arrays[i]
+            full_h, full_w = rgb_array.shape[:2]
+            full_bytes += full_h * full_w
+            if max_side is not None and max(full_h, full_w) > max_side:
+                scale = max_side / max(full_h, full_w)
+                rgb_array = cv2.resize(np.ascontiguousarray(rgb_array), (round(full_w * scale), round(full_h * scale)),
+                                       interpolation=cv2.INTER_AREA)
+            inputs.append(Image.fromarray(np.ascontiguousarray(rgb_array)))
+
+        # Inference
+        t0 = time.perf_counter()
+        depth_arrays = backend.batch(inputs)
+        elapsed = time.perf_counter() - t0
+
+        depth_bytes = sum(d.nbytes for d in depth_arrays)
+        full_bytes *= depth_arrays[0].itemsize
+        sizes = ", ".join(f"{d.shape[1]}x{d.shape[0]}" for d in depth_arrays)
+        print(f"[DEPTH] {backend.name}: {len(chunk)} image(s) at {sizes} in {elapsed:.2f}s, "
+              f"depth maps {depth_bytes / 1e6:.2f} MB (saved {(full_bytes - depth_bytes) / 1e6:.2f} MB "
+              f"vs full resolution)")
+
+        for i, depth_array in zip(chunk, depth_arrays):
+            results[i] = (Image.fromarray(depth_array), depth_array)
+            if keys[i] is not None:
+                _cache_store(keys[i], depth_array)
+
+    return results
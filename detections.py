@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+
+def _to_numpy(values):
+    """Tensor (any device) or array-like -> NumPy array."""
+    if hasattr(values, "cpu"):
+        values = values.cpu().numpy()
+    return np.asarray(values)
+
+
+def _merge_vocab(vocab, names):
+    """Adds names to vocab (name -> code), returns the code of each name."""
+    return np.array([vocab.setdefault(name, len(vocab)) for name in names], dtype=np.uint16)
+
+
+class Detections:
+    """
+    Detections of one image as NumPy columns.
+
+    Replaces the per-box lists of dicts: one row per box, with the class and
+    model source stored as small integer codes into shared vocabularies.
+    Nothing is formatted (timestamps, percentages, list coordinates) until a
+    report is exported or displayed.
+
+    Columns:
+        boxes: int32 (N, 4) x1, y1, x2, y2 in image pixels.
+        conf: float32 (N,).
+        cls: uint16 (N,) index into classes [(object_type, evidence_type), ...].
+        source_ids: uint16 (N,) index into sources.
+        evidence_class: bool (N,) class is on the detector's evidence list.
+    """
+    __slots__ = ("boxes", "conf", "cls", "source_ids", "evidence_class", "classes", "sources")
+
+    def __init__(self, boxes, conf, cls, source_ids, evidence_class, classes, sources):
+        self.boxes = boxes
+        self.conf = conf
+        self.cls = cls
+        self.source_ids = source_ids
+        self.evidence_class = evidence_class
+        self.classes = classes
+        self.sources = sources
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 4), np.int32), np.empty(0, np.float32), np.empty(0, np.uint16),
+                   np.empty(0, np.uint16), np.empty(0, bool), [], [])
+
+    @classmethod
+    def from_yolo(cls, result, source, class_map, keep_all=False, scale=1.0):
+        """
+        Converts one Ultralytics result without a per-box Python loop.
+
+        Args:
+            result: ultralytics Results (result.boxes, result.names) or None.
+            source: Model source name (e.g. "Standard_Model").
+            class_map: {class id: evidence label}. Other classes are dropped
+                unless keep_all=True, in which case they keep their raw name
+                and evidence_class=False.
+            scale: Boxes are divided by it (detection on a resized copy).
+        """
+        if result is None or len(result.boxes) == 0:
+            return cls.empty()
+
+        ids = _to_numpy(result.boxes.cls).astype(np.int64)
+        conf = _to_numpy(result.boxes.conf).astype(np.float32)
+        xyxy = _to_numpy(result.boxes.xyxy)
+        if scale != 1.0:
+            xyxy = xyxy / scale
+
+        in_map = np.isin(ids, list(class_map))
+        if not keep_all:
+            ids, conf, xyxy, in_map = ids[in_map], conf[in_map], xyxy[in_map], in_map[in_map]
+
+        # Class codes: one vocabulary entry per distinct class id in this image
+        uniq, codes = np.unique(ids, return_inverse=True)
+        classes = [(result.names[u], class_map.get(u, result.names[u])) for u in uniq.tolist()]
+
+        return cls(xyxy.astype(np.int32).reshape(-1, 4), conf, codes.astype(np.uint16).reshape(-1),
+                   np.zeros(len(ids), np.uint16), in_map, classes, [source])
+
+    @classmethod
+    def concat(cls, parts):
+        """Fuses the detections of several models (row order is kept)."""
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+
+        class_vocab, source_vocab = {}, {}
+        cls_cols, src_cols = [], []
+        for p in parts:
+            cls_cols.append(_merge_vocab(class_vocab, p.classes)[p.cls])
+            src_cols.append(_merge_vocab(source_vocab, p.sources)[p.source_ids])
+        return cls(np.concatenate([p.boxes for p in parts]), np.concatenate([p.conf for p in parts]),
+                   np.concatenate(cls_cols), np.concatenate(src_cols),
+                   np.concatenate([p.evidence_class for p in parts]), list(class_vocab), list(source_vocab))
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __getitem__(self, index):
+        """Row subset (mask, indices or slice) sharing the vocabularies."""
+        return Detections(self.boxes[index], self.conf[index], self.cls[index], self.source_ids[index],
+                          self.evidence_class[index], self.classes, self.sources)
+
+    @property
+    def nbytes(self):
+        return (self.boxes.nbytes + self.conf.nbytes + self.cls.nbytes + self.source_ids.nbytes
+                + self.evidence_class.nbytes)
+
+    @property
+    def labels(self):
+        """Evidence label of every row (object array)."""
+        return np.array([c[1] for c in self.classes] or [""], dtype=object)[self.cls]
+
+    @property
+    def object_types(self):
+        """Raw model class name of every row (object array)."""
+        return np.array([c[0] for c in self.classes] or [""], dtype=object)[self.cls]
+
+    @property
+    def source_names(self):
+        return np.array(self.sources or [""], dtype=object)[self.source_ids]
+
+    def clip(self, img_w, img_h):
+        """Clamps boxes to the image (in place), returns self."""
+        np.maximum(self.boxes[:, :2], 0, out=self.boxes[:, :2])
+        np.minimum(self.boxes[:, 2], img_w, out=self.boxes[:, 2])
+        np.minimum(self.boxes[:, 3], img_h, out=self.boxes[:, 3])
+        return self
+
+    def scaled(self, factor):
+        """Copy with boxes multiplied by factor (e.g. original -> working image pixels)."""
+        if factor == 1.0:
+            return self
+        boxes = np.rint(self.boxes * factor).astype(np.int32)
+        return Detections(boxes, self.conf, self.cls, self.source_ids, self.evidence_class, self.classes,
+                          self.sources)
+
+    def above(self, cutoff):
+        """Rows with conf > cutoff."""
+        return self[self.conf > cutoff]
+
+    def select(self, labels=None, min_conf=None):
+        mask = np.ones(len(self), bool)
+        if labels is not None:
+            mask &= np.isin(self.labels, list(labels))
+        if min_conf is not None:
+            mask &= self.conf > min_conf
+        return self[mask]
+
+    def sorted(self):
+        """Highest confidence first."""
+        return self[np.argsort(-self.conf, kind="stable")]
+
+    def items(self):
+        """[{Label, Conf, Box}] for overlays and VR scenes (use on visible rows)."""
+        return [{"Label": label, "Conf": conf, "Box": box}
+                for label, conf, box in zip(self.labels.tolist(), self.conf.tolist(), self.boxes.tolist())]
+
+    def to_rows(self):
+        """Row dicts (evidence index / legacy callers), built on demand."""
+        return [{"Model_Source": src, "Object_Type": obj, "Evidence_Type": label, "Confidence_Score": conf,
+                 "Evidence_Class": evid, "Coords": box}
+                for src, obj, label, conf, evid, box in zip(
+                    self.source_names.tolist(), self.object_types.tolist(), self.labels.tolist(),
+                    self.conf.tolist(), self.evidence_class.tolist(), self.boxes.tolist())]
+
+    def to_dataframe(self, timestamp, cutoff):
+        """Report table (same columns as the app's CSV export), formatted here only."""
+        conf = self.conf.astype(float)
+        return pd.DataFrame({
+            "Timestamp": timestamp,
+            "Model_Source": self.source_names,
+            "Evidence_Type": self.labels,
+            "Confidence_Score": conf,
+            "Confidence_Text": [f"{c:.2%}" for c in conf],
+            "Visualized": np.where(conf > cutoff, "YES", "NO"),
+            "Coords": self.boxes.tolist()
+        })
@@ -1,9 +1,18 @@
 import cv2
 from ultralytics import YOLO
-import pandas as pd
 from datetime import datetime
 import os
-import glob
+import time
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from evidence_store import EvidenceStore, export_csv
+from evidence_index import EvidenceIndex, EVIDENCE_INDEX_PATH
+from detections import Detections
+from image_io import read_image, iter_images, input_root, image_name
+from dedupe import Deduplicator
+from depth_utils import estimate_depth_batch, DEPTH_WORKING_MAX_SIDE
+from vr_utils import create_aframe_scene, create_vr_index, write_asset, make_displacement_map, build_depth_glb
+from vr_utils import install_vendor_assets, make_gallery_entry, create_vr_gallery
 
 
 class EnsembleEvidenceDetector:
@@ -20,9 +29,15 @@ class EnsembleEvidenceDetector:
         else:
             print(f"[WARNING] Custom weights '{custom_weights}' not found! Gun/Blood detection will be skipped.")
             self.model_custom = None
+        # Recorded with every run in the evidence store
+        self.weights = {"standard_weights": standard_weights,
+                        "custom_weights": custom_weights if self.model_custom else None}
 
         # --- CONFIGURATION ---
         self.VISUAL_CUTOFF = 0.30  # Only draw on image if > 35%
+        # Larger photos are decoded at 1/2, 1/4 or 1/8 scale (long side stays >= this);
+        # detections are logged in original pixels. None = always full resolution.
+        self.WORKING_MAX_SIDE = 2048
 
         # 1. Standard Model Targets (COCO IDs)
         self.std_classes = {
@@ -50,149 +65,259 @@ class EnsembleEvidenceDetector:
             "bg_label": (50, 50, 50)  # Dark Grey
         }
 
-    def process_directory(self, input_dir, output_root='ensemble_results'):
-        csv_dir = os.path.join(output_root, "evidence_logs")
+    def process_directory(self, input_dir, output_root='ensemble_results', vr=False, depth_batch_size=4,
+                          vr_mesh=False, write_csv=False, index_path=EVIDENCE_INDEX_PATH, dedupe=None):
+        """
+        Runs the ensemble over every image under input_dir (a folder or a glob
+        such as "crime_scenes/*"; subfolders included, non-images skipped).
+        Visualized detections are appended to the columnar evidence store in
+        '<output_root>/evidence_store/' (one partition per run), the full
+        conf=0.001 stream to the run's binary debug log (debug_log.py);
+        write_csv=True also exports the old per-image CSVs to 'evidence_logs/'.
+        Every image is also added to the SQLite evidence index at index_path
+        (None to skip).
+        With vr=True, depth maps are estimated in batches alongside the YOLO
+        passes and one VR scene per image is written to '<output_root>/vr/'.
+        vr_mesh=True bakes each scene's depth into a .glb mesh instead of
+        displacing a plane in the browser.
+        dedupe="reuse" gives near-duplicate images (perceptual hash, dedupe.py)
+        the detections of the first copy instead of running the models again;
+        dedupe="skip" leaves them out. Clusters are reported in
+        '<output_root>/dedupe_<run>.json'.
+        """
+        store_dir = os.path.join(output_root, "evidence_store")
         visuals_dir = os.path.join(output_root, "visuals")
-        os.makedirs(csv_dir, exist_ok=True)
         os.makedirs(visuals_dir, exist_ok=True)
 
-        image_files = glob.glob(input_dir)
+        # Streamed: processing starts with the first image found
+        image_files = iter_images(input_dir, exclude=[output_root])
+        # Image names are relative to it, so same-named files in subfolders stay apart
+        root = input_root(input_dir)
+
+        print(f"[INFO] Scanning '{input_dir}'. Starting Ensemble Scan...")
+
+        metadata = {"input": input_dir, "visual_cutoff": self.VISUAL_CUTOFF, "dedupe": dedupe, **self.weights}
+        index = EvidenceIndex(index_path) if index_path else None
+        deduper = Deduplicator(reuse=(dedupe == "reuse")) if dedupe else None
+        with EvidenceStore(store_dir, tool="ensemble", metadata=metadata, index=index,
+                           debug_log=True, cutoff=self.VISUAL_CUTOFF) as store:
+            if vr:
+                self._process_with_vr(image_files, output_root, store, visuals_dir, depth_batch_size, vr_mesh,
+                                      deduper, root)
+            else:
+                for img_path in image_files:
+                    self._analyze_image(img_path, store, visuals_dir, dedupe=deduper, root=root)
+        if index is not None:
+            index.close()
+
+        if deduper is not None:
+            deduper.save(os.path.join(output_root, f"dedupe_{store.run_id}.json"))
+            print(deduper.summary_line())
+
+        if write_csv:
+            export_csv(output_root, store_dir, tool="ensemble", run=store.run_id)
+
+        print(f"\n[COMPLETE] {store.n_images} images. Results saved to '{output_root}/' (run {store.run_id})")
+
+    def _process_with_vr(self, image_files, output_root, store, visuals_dir, depth_batch_size, vr_mesh=False,
+                         dedupe=None, root=None):
+        vr_dir = os.path.join(output_root, "vr")
+        # Images/depth maps go to one shared, content-addressed folder
+        asset_dir = os.path.join(vr_dir, "assets")
+        os.makedirs(asset_dir, exist_ok=True)
+        # Offline A-Frame bundle, copied once for all scenes (fails fast if missing)
+        install_vendor_assets(vr_dir)
+        scenes = []
+        gallery = []
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            image_files = iter(image_files)
+            while True:
+                paths = list(islice(image_files, depth_batch_size))
+                if not paths:
+                    break
+                chunk = []
+                for img_path in paths:
+                    img, scale, size = read_image(img_path, self.WORKING_MAX_SIDE)
+                    if img is None:
+                        continue
+                    # Near-duplicates are checked first, so skipped ones never get depth
+                    original = dedupe.check(img_path, img) if dedupe is not None else None
+                    if original is not None and not dedupe.reuse:
+                        print(f" > Skipped {image_name(img_path, root)}: "
+                              f"near-duplicate of {image_name(original, root)}")
+                        continue
+                    chunk.append((img_path, img, scale, size, original))
+                if not chunk:
+                    continue
+
+                # Depth for the whole chunk runs while YOLO works through it
+                depth_future = pool.submit(estimate_depth_batch, [img for _, img, _, _, _ in chunk],
+                                           max_side=DEPTH_WORKING_MAX_SIDE, batch_size=depth_batch_size)
+                detections = [self._analyze_image(img_path, store, visuals_dir, img=img, scale=scale, size=size,
+                                                  dedupe=dedupe, original=original, checked=True, root=root)
+                              for img_path, img, scale, size, original in chunk]
+
+                for (img_path, img, _, _, _), vr_detections, (_, depth_array) in zip(chunk, detections,
+                                                                                     depth_future.result()):
+                    scene, entry = self._write_vr_scene(img_path, img, vr_detections, depth_array, vr_dir,
+                                                        asset_dir, vr_mesh, root)
+                    scenes.append(scene)
+                    gallery.append(entry)
+
+        # One page to walk through the whole case, scenes are loaded on demand
+        gallery_path = create_vr_gallery(gallery, os.path.join(vr_dir, "gallery.html"))
+        create_vr_index(scenes, os.path.join(vr_dir, "index.html"), gallery=gallery_path)
+        print(f"[VR] Wrote {len(scenes)} scenes + gallery + index to '{vr_dir}/'")
+
+    def _write_vr_scene(self, image_path, img, vr_detections, depth_array, vr_dir, asset_dir, vr_mesh=False,
+                        root=None):
+        base_name = image_name(image_path, root)
+        img_h, img_w = img.shape[:2]
 
-        print(f"[INFO] Found {len(image_files)} images. Starting Ensemble Scan...")
+        _, rgb_jpg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        rgb_path = write_asset(rgb_jpg.tobytes(), ".jpg", asset_dir)
 
-        for img_path in image_files:
-            self._analyze_image(img_path, csv_dir, visuals_dir)
+        depth_path = mesh_path = None
+        if vr_mesh:
+            glb, stats = build_depth_glb(depth_array, rgb_jpg.tobytes(), img_w, img_h)
+            mesh_path = write_asset(glb, ".glb", asset_dir)
+            print(f"   [VR] Baked mesh: {stats['Triangles']} triangles ({stats['Full_Triangles']} for the full grid)")
+        else:
+            depth_path = write_asset(make_displacement_map(depth_array), ".png", asset_dir)
 
-        print(f"\n[COMPLETE] Results saved to '{output_root}/'")
+        scene_path = os.path.join(vr_dir, f"{base_name}.html")
+        create_aframe_scene(vr_detections, rgb_path, depth_path, depth_array, img_w, img_h, scene_path,
+                            mesh_path=mesh_path)
+        entry = make_gallery_entry(base_name, vr_detections, rgb_path, depth_path, depth_array, img_w, img_h,
+                                   mesh_path=mesh_path)
+        return {"Name": base_name, "Scene": scene_path, "Thumb": rgb_path, "Count": len(vr_detections)}, entry
 
-    def _analyze_image(self, image_path, csv_dir, visuals_dir):
-        img = cv2.imread(image_path)
-        if img is None: return
-        base_name = os.path.splitext(os.path.basename(image_path))[0]
+    def _analyze_image(self, image_path, store, visuals_dir, img=None, scale=1.0, size=None, dedupe=None,
+                       original=None, checked=False, root=None):
+        """
+        Runs both models on one image, logs it to the evidence store and saves its visual.
+        img may be a reduced decode (see read_image): scale = img / original width,
+        size = original (width, height). Detections are logged in original pixels;
+        the visual and the returned VR detections (Label, Conf, Box) use img pixels.
+        Returns None for a near-duplicate skipped by dedupe. checked=True: the
+        caller already ran dedupe.check on img and passes its result as original.
+        Outputs are named after the path relative to root (see image_name).
+        """
+        if img is None:
+            img, scale, size = read_image(image_path, self.WORKING_MAX_SIDE)
+        if img is None: return []
+        base_name = image_name(image_path, root)
 
         # Get Image Dimensions for Boundary Checks
         img_h, img_w = img.shape[:2]
+        orig_w, orig_h = size or (img_w, img_h)
+
+        # --- PASS 0: NEAR-DUPLICATE CHECK ---
+        if dedupe is not None and not checked:
+            original = dedupe.check(image_path, img)
+        if original is not None and not dedupe.reuse:
+            print(f" > Skipped {base_name}: near-duplicate of {image_name(original, root)}")
+            return None
+
+        if original is not None:
+            # Same photo: the first copy's detections, rescaled to this image
+            prev, prev_w = dedupe.results[original]
+            dets = prev.scaled(orig_w / prev_w).clip(orig_w, orig_h)
+            print(f"   [DEDUPE] Reusing detections of {image_name(original, root)}")
+        else:
+            start = time.perf_counter()
+            log_args = {"project": "yolo_internal_logs", "name": "inference", "exist_ok": True}
+
+            # --- PASS 1: STANDARD MODEL ---
+            res_std = self.model_standard.predict(img, conf=0.001, iou=0.5, verbose=False, **log_args)[0]
+            parts = [Detections.from_yolo(res_std, "Standard_Model", self.std_classes, scale=scale)]
+
+            # --- PASS 2: CUSTOM MODEL (Guns/Blood) ---
+            if self.model_custom:
+                res_cust = self.model_custom.predict(img, conf=0.001, iou=0.5, verbose=False, **log_args)[0]
+                parts.append(Detections.from_yolo(res_cust, "Custom_Model", self.cust_classes, scale=scale))
 
-        master_log = []
-        log_args = {"project": "yolo_internal_logs", "name": "inference", "exist_ok": True}
-
-        # --- PASS 1: STANDARD MODEL ---
-        res_std = self.model_standard.predict(img, conf=0.001, iou=0.5, verbose=False, **log_args)[0]
-        for box in res_std.boxes:
-            cls_id = int(box.cls[0])
-            if cls_id in self.std_classes:
-                master_log.append({
-                    "Source": "Standard_Model",
-                    "Label": self.std_classes[cls_id],
-                    "Conf": float(box.conf[0]),
-                    "Box": box.xyxy[0].tolist()
-                })
-
-        # --- PASS 2: CUSTOM MODEL (Guns/Blood) ---
-        if self.model_custom:
-            res_cust = self.model_custom.predict(img, conf=0.001, iou=0.5, verbose=False, **log_args)[0]
-            for box in res_cust.boxes:
-                cls_id = int(box.cls[0])
-                if cls_id in self.cust_classes:
-                    master_log.append({
-                        "Source": "Custom_Model",
-                        "Label": self.cust_classes[cls_id],
-                        "Conf": float(box.conf[0]),
-                        "Box": box.xyxy[0].tolist()
-                    })
+            # Clamp coordinates to stay within image (Just in case)
+            dets = Detections.concat(parts).clip(orig_w, orig_h)
+            if dedupe is not None:
+                if dedupe.reuse:
+                    dedupe.results[image_path] = (dets, orig_w)
+                dedupe.record_time(time.perf_counter() - start)
 
         # --- PASS 3: PROCESSING & VISUALIZATION ---
+        timestamp = datetime.now()
         annotated_img = img.copy()
-        csv_data = []
 
-        for item in master_log:
+        # Draw Visuals (High Confidence Only)
+        vr_detections = dets.above(self.VISUAL_CUTOFF).scaled(scale).items()
+        for item in vr_detections:
             label = item['Label']
             conf = item['Conf']
-            x1, y1, x2, y2 = map(int, item['Box'])
-
-            # Clamp coordinates to stay within image (Just in case)
-            x1 = max(0, x1);
-            y1 = max(0, y1)
-            x2 = min(img_w, x2);
-            y2 = min(img_h, y2)
-
-            # A. Add to CSV Data
-            csv_data.append({
-                "Timestamp": datetime.now().isoformat(),
-                "Image": base_name,
-                "Model_Source": item['Source'],
-                "Evidence_Type": label,
-                "Confidence_Score": conf,
-                "Confidence_Text": f"{conf:.2%}",
-                "Visualized": "YES" if conf > self.VISUAL_CUTOFF else "NO",
-                "Coords": [x1, y1, x2, y2]
-            })
-
-            # B. Draw Visuals (High Confidence Only)
-            if conf > self.VISUAL_CUTOFF:
-                # Color Selection
-                if "Blood" in label:
-                    c = self.colors["biohazard"]
-                elif "Gun" in label:
-                    c = self.colors["weapon_gun"]
-                elif "Knife" in label:
-                    c = self.colors["weapon_knife"]
-                elif "Person" in label:
-                    c = self.colors["person"]
-                elif "Phone" in label or "Laptop" in label:
-                    c = self.colors["digital"]
-                else:
-                    c = self.colors["general"]
-
-                # Draw Box
-                cv2.rectangle(annotated_img, (x1, y1), (x2, y2), c, 2)
-
-                # --- BOUNDARY AWARE LABEL DRAWING ---
-                lbl = f"{label} {conf:.0%}"
-                # Get text size
-                (text_w, text_h), baseline = cv2.getTextSize(lbl, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
-
-                # Default: Draw ABOVE the box
-                # Coordinates for background rectangle
-                bg_x1 = x1
-                bg_y1 = y1 - text_h - 10
-                bg_x2 = x1 + text_w + 10
-                bg_y2 = y1
-
-                # Coordinate for text baseline
-                text_x = x1 + 5
-                text_y = y1 - 5
-
-                # CHECK 1: Top Boundary (If text goes off top edge)
-                if y1 - text_h - 10 < 0:
-                    # FLIP: Draw INSIDE/BELOW the top line
-                    bg_y1 = y1
-                    bg_y2 = y1 + text_h + 10
-                    text_y = y1 + text_h + 5
-
-                # CHECK 2: Right Boundary (If text goes off right edge)
-                if x1 + text_w + 10 > img_w:
-                    # SHIFT: Move text left to fit
-                    shift_amount = (x1 + text_w + 10) - img_w
-                    bg_x1 -= shift_amount
-                    bg_x2 -= shift_amount
-                    text_x -= shift_amount
-
-                # Draw Label Background
-                cv2.rectangle(annotated_img, (bg_x1, bg_y1), (bg_x2, bg_y2), self.colors["bg_label"], -1)
-
-                # Draw Text
-                cv2.putText(annotated_img, lbl, (text_x, text_y),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1, self.colors["text"], 2)
+            x1, y1, x2, y2 = item['Box']
+
+            # Color Selection
+            if "Blood" in label:
+                c = self.colors["biohazard"]
+            elif "Gun" in label:
+                c = self.colors["weapon_gun"]
+            elif "Knife" in label:
+                c = self.colors["weapon_knife"]
+            elif "Person" in label:
+                c = self.colors["person"]
+            elif "Phone" in label or "Laptop" in label:
+                c = self.colors["digital"]
+            else:
+                c = self.colors["general"]
+
+            # Draw Box
+            cv2.rectangle(annotated_img, (x1, y1), (x2, y2), c, 2)
+
+            # --- BOUNDARY AWARE LABEL DRAWING ---
+            lbl = f"{label} {conf:.0%}"
+            # Get text size
+            (text_w, text_h), baseline = cv2.getTextSize(lbl, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
+
+            # Default: Draw ABOVE the box
+            # Coordinates for background rectangle
+            bg_x1 = x1
+            bg_y1 = y1 - text_h - 10
+            bg_x2 = x1 + text_w + 10
+            bg_y2 = y1
+
+            # Coordinate for text baseline
+            text_x = x1 + 5
+            text_y = y1 - 5
+
+            # CHECK 1: Top Boundary (If text goes off top edge)
+            if y1 - text_h - 10 < 0:
+                # FLIP: Draw INSIDE/BELOW the top line
+                bg_y1 = y1
+                bg_y2 = y1 + text_h + 10
+                text_y = y1 + text_h + 5
+
+            # CHECK 2: Right Boundary (If text goes off right edge)
+            if x1 + text_w + 10 > img_w:
+                # SHIFT: Move text left to fit
+                shift_amount = (x1 + text_w + 10) - img_w
+                bg_x1 -= shift_amount
+                bg_x2 -= shift_amount
+                text_x -= shift_amount
+
+            # Draw Label Background
+            cv2.rectangle(annotated_img, (bg_x1, bg_y1), (bg_x2, bg_y2), self.colors["bg_label"], -1)
+
+            # Draw Text
+            cv2.putText(annotated_img, lbl, (text_x, text_y),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, self.colors["text"], 2)
 
         # --- SAVING ---
-        if csv_data:
-            df = pd.DataFrame(csv_data)
-            df = df.sort_values(by="Confidence_Score", ascending=False)
-            df.to_csv(os.path.join(csv_dir, f"{base_name}_FULL_REPORT.csv"), index=False)
+        # Every detection is logged; reports are formatted only when exported
+        store.append(base_name, dets, timestamp, size=(orig_w, orig_h))
 
         cv2.imwrite(os.path.join(visuals_dir, f"{base_name}_ANALYSIS.jpg"), annotated_img)
-        print(f" > Processed {base_name}: {len(csv_data)} items logged.")
+        print(f" > Processed {base_name}: {len(dets)} items logged.")
+        return vr_detections
 
 
 # --- EXECUTION ---
@@ -205,4 +330,5 @@ if __name__ == "__main__":
 
     INPUT_FOLDER = "crime_scenes/*"
 
-    detector.process_directory(INPUT_FOLDER)
\ No newline at end of file
+    # vr=True also writes one 3D scene per image + a case index (needs the depth model)
+    detector.process_directory(INPUT_FOLDER, vr=False)
\ No newline at end of file
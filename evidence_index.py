@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+# --- CONFIGURATION ---
+EVIDENCE_INDEX_PATH = "evidence_index.sqlite"  # Shared by the batch runners and the app
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    image TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    run_id TEXT,
+    width INTEGER,
+    height INTEGER,
+    analyzed TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    model_source TEXT,
+    evidence_type TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    above_cutoff INTEGER NOT NULL,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER
+);
+-- Box coordinates (pixels), same id as detections.id
+CREATE VIRTUAL TABLE IF NOT EXISTS detection_boxes USING rtree(id, min_x, max_x, min_y, max_y);
+
+CREATE INDEX IF NOT EXISTS idx_images_analyzed ON images(analyzed);
+CREATE INDEX IF NOT EXISTS idx_images_image ON images(image);
+CREATE INDEX IF NOT EXISTS idx_images_run ON images(run_id);
+CREATE INDEX IF NOT EXISTS idx_detections_label_conf ON detections(evidence_type, confidence);
+CREATE INDEX IF NOT EXISTS idx_detections_conf ON detections(confidence);
+CREATE INDEX IF NOT EXISTS idx_detections_image ON detections(image_id);
+"""
+
+QUERY_COLUMNS = ["image", "tool", "run_id", "analyzed", "model_source", "evidence_type",
+                 "confidence", "above_cutoff", "x1", "y1", "x2", "y2"]
+
+
+class EvidenceIndex:
+    """
+    Local SQLite index of every analyzed image and its detections.
+
+    B-tree indexes cover label/confidence, image and analysis time; an
+    R-tree over the boxes answers region queries without scanning. Safe
+    to share between threads (one connection, serialized by a lock).
+    """
+
+    def __init__(self, path=EVIDENCE_INDEX_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+
+    def add_image(self, image, rows, tool, run_id=None, size=None, analyzed=None, cutoff=None):
+        """
+        Indexes one analyzed image. Returns its image id.
+
+        Args:
+            image: Image name.
+            rows: Dicts with Evidence_Type, Confidence_Score, Coords and optionally
+                Model_Source, Above_Cutoff.
+            tool: "ensemble", "yolo_marked", "app", ...
+            size: Optional (width, height).
+            analyzed: datetime (defaults to now).
+            cutoff: Used for Above_Cutoff when a row does not carry it.
+        """
+        width, height = size if size is not None else (None, None)
+        analyzed = (analyzed or datetime.now()).isoformat()
+
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO images (image, tool, run_id, width, height, analyzed) VALUES (?, ?, ?, ?, ?, ?)",
+                (image, tool, run_id, width, height, analyzed))
+            image_id = cur.lastrowid
+
+            records = []
+            for row in rows:
+                conf = float(row['Confidence_Score'])
+                above = row.get('Above_Cutoff', conf > cutoff if cutoff is not None else True)
+                x1, y1, x2, y2 = (int(v) for v in row['Coords'])
+                records.append((image_id, row.get('Model_Source'), row['Evidence_Type'], conf, int(bool(above)),
+                                x1, y1, x2, y2))
+            self._conn.executemany(
+                "INSERT INTO detections (image_id, model_source, evidence_type, confidence, above_cutoff,"
+                " x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+            self._conn.execute(
+                "INSERT INTO detection_boxes SELECT id, MIN(x1, x2), MAX(x1, x2), MIN(y1, y2), MAX(y1, y2)"
+                " FROM detections WHERE image_id = ?",
+                (image_id,))
+        return image_id
+
+    def query(self, label=None, min_conf=None, last=None, region=None, inside=False, image=None,
+              tool=None, run_id=None, limit=None):
+        """
+        Finds detections across all indexed images.
+
+        Args:
+            label: Evidence type, exact match (e.g. "Gun").
+            min_conf: Only detections with confidence >= min_conf.
+            last: Only the `last` most recently analyzed images.
+            region: (x1, y1, x2, y2) in pixels; boxes intersecting it
+                (or fully inside it with inside=True).
+            image, tool, run_id: Exact filters on the image record.
+            limit: Maximum number of rows.
+        Returns:
+            DataFrame with QUERY_COLUMNS, highest confidence first.
+        """
+        sql = ["SELECT i.image, i.tool, i.run_id, i.analyzed, d.model_source, d.evidence_type,",
+               " d.confidence, d.above_cutoff, d.x1, d.y1, d.x2, d.y2",
+               " FROM detections d JOIN images i ON i.id = d.image_id"]
+        where, params = [], []
+
+        if region is not None:
+            rx1, ry1, rx2, ry2 = region
+            sql.append(" JOIN detection_boxes b ON b.id = d.id")
+            if inside:
+                where.append("b.min_x >= ? AND b.max_x <= ? AND b.min_y >= ? AND b.max_y <= ?")
+                params += [rx1, rx2, ry1, ry2]
+            else:
+                where.append("b.max_x >= ? AND b.min_x <= ? AND b.max_y >= ? AND b.min_y <= ?")
+                params += [rx1, rx2, ry1, ry2]
+        if label is not None:
+            where.append("d.evidence_type = ?")
+            params.append(label)
+        if min_conf is not None:
+            where.append("d.confidence >= ?")
+            params.append(min_conf)
+        if last is not None:
+            where.append("d.image_id IN (SELECT id FROM images ORDER BY analyzed DESC LIMIT ?)")
+            params.append(int(last))
+        for column, value in (("i.image", image), ("i.tool", tool), ("i.run_id", run_id)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+
+        if where:
+            sql.append(" WHERE " + " AND ".join(where))
+        sql.append(" ORDER BY d.confidence DESC")
+        if limit is not None:
+            sql.append(" LIMIT ?")
+            params.append(int(limit))
+
+        with self._lock:
+            rows = self._conn.execute("".join(sql), params).fetchall()
+        return pd.DataFrame(rows, columns=QUERY_COLUMNS)
+
+    def summary(self, min_conf=None):
+        """Detections and images per evidence type."""
+        sql = ("SELECT evidence_type, COUNT(*) AS detections, COUNT(DISTINCT image_id) AS images,"
+               " AVG(confidence) AS avg_conf FROM detections")
+        params = []
+        if min_conf is not None:
+            sql += " WHERE confidence >= ?"
+            params.append(min_conf)
+        sql += " GROUP BY evidence_type ORDER BY detections DESC"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=["evidence_type", "detections", "images", "avg_conf"])
+
+    def has_run(self, run_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM images WHERE run_id = ? LIMIT 1", (run_id,)).fetchone() is not None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def index_store(index, store_root):
+    """
+    Adds every run of a Parquet evidence store (evidence_store.py) that is
+    not indexed yet. Returns the number of images added.
+    """
+    from evidence_store import load_evidence, load_runs
+
+    added = 0
+    for run in load_runs(store_root):
+        if index.has_run(run["run_id"]):
+            continue
+        df = load_evidence(store_root, run=run["run_id"])
+        for image, group in df.groupby("image", sort=False, observed=True):
+            rows = [{"Model_Source": str(src), "Evidence_Type": str(lbl), "Confidence_Score": conf,
+                     "Above_Cutoff": bool(above), "Coords": (x1, y1, x2, y2)}
+                    for src, lbl, conf, above, x1, y1, x2, y2 in zip(
+                        group["model_source"], group["evidence_type"], group["confidence"],
+                        group["above_cutoff"], group["x1"], group["y1"], group["x2"], group["y2"])]
+            index.add_image(image, rows, run["tool"], run_id=run["run_id"],
+                            analyzed=group["timestamp"].iloc[0].to_pydatetime())
+            added += 1
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the local evidence index")
+    parser.add_argument("--db", default=EVIDENCE_INDEX_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    q = sub.add_parser("query", help="Find detections, e.g. query --label Gun --min-conf 0.6 --last 500")
+    q.add_argument("--label")
+    q.add_argument("--min-conf", type=float)
+    q.add_argument("--last", type=int, help="Only the N most recently analyzed images")
+    q.add_argument("--region", type=int, nargs=4, metavar=("X1", "Y1", "X2", "Y2"))
+    q.add_argument("--inside", action="store_true", help="Box must lie fully inside --region")
+    q.add_argument("--image")
+    q.add_argument("--tool")
+    q.add_argument("--run")
+    q.add_argument("--limit", type=int)
+    q.add_argument("--csv", help="Write the result to this CSV file")
+
+    s = sub.add_parser("summary", help="Counts per evidence type")
+    s.add_argument("--min-conf", type=float)
+
+    b = sub.add_parser("import", help="Index all new runs of a Parquet evidence store")
+    b.add_argument("store_root")
+
+    args = parser.parse_args()
+    with EvidenceIndex(args.db) as index:
+        if args.command == "query":
+            start = datetime.now()
+            df = index.query(label=args.label, min_conf=args.min_conf, last=args.last, region=args.region,
+                             inside=args.inside, image=args.image, tool=args.tool, run_id=args.run,
+                             limit=args.limit)
+            elapsed = (datetime.now() - start).total_seconds() * 1000
+            if args.csv:
+                df.to_csv(args.csv, index=False)
+            else:
+                print(df.to_string(index=False))
+            print(f"[INDEX] {len(df)} detections in {elapsed:.1f} ms")
+        elif args.command == "summary":
+            print(index.summary(args.min_conf).to_string(index=False))
+        else:
+            print(f"[INDEX] Added {index_store(index, args.store_root)} images from '{args.store_root}'")
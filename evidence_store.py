@@ -0,0 +1,327 @@
+import os
+import glob
+import json
+import uuid
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from debug_log import DebugLogWriter, DebugLog, has_debug_log
+
+# --- CONFIGURATION ---
+EVIDENCE_STORE_DIR = os.path.join("ensemble_results", "evidence_store")
+FLUSH_ROWS = 50_000  # Rows buffered per Parquet part file
+RUNS_DIR = "_runs"  # Run metadata (ignored by dataset scans)
+
+# One typed schema for every tool. Partitioned on disk as
+# <root>/tool=<tool>/run=<run_id>/part-00000.parquet
+EVIDENCE_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("us")),
+    ("image", pa.string()),
+    ("model_source", pa.dictionary(pa.int8(), pa.string())),
+    ("object_type", pa.dictionary(pa.int16(), pa.string())),  # Raw model class
+    ("evidence_type", pa.dictionary(pa.int16(), pa.string())),  # Forensic label
+    ("confidence", pa.float32()),
+    ("evidence_class", pa.bool_()),  # Class is on the tool's evidence list
+    ("above_cutoff", pa.bool_()),  # Visualized / official at the tool's cutoff
+    ("x1", pa.int32()),
+    ("y1", pa.int32()),
+    ("x2", pa.int32()),
+    ("y2", pa.int32()),
+])
+
+# Legacy CSV file suffix -> folder under the tool's output root
+LEGACY_SUBDIRS = {
+    "_FULL_REPORT.csv": "evidence_logs",
+    "_EVIDENCE.csv": "official_logs",
+    "_DEBUG.csv": "debug_data",
+}
+PARTITION_SCHEMA = pa.schema([("tool", pa.string()), ("run", pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+
+
+def new_run_id():
+    """Sortable, collision-free run id (e.g. 20260101T120000-1a2b3c)."""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+class EvidenceStore:
+    """
+    Append-only columnar log of detections for one batch run.
+
+    Rows are buffered and written as Parquet part files of FLUSH_ROWS rows,
+    so a run produces a handful of files instead of one CSV per image.
+    Boxes are stored as typed x1/y1/x2/y2 columns.
+
+    If an EvidenceIndex is given, every appended image is also added to
+    the SQLite index for cross-case queries.
+
+    With debug_log=True the full raw stream (conf=0.001) goes to a compact
+    binary debug log (debug_log.py) in the run folder, and only rows above
+    the tool's cutoff are written to Parquet / the index.
+
+    Usage:
+        with EvidenceStore(root, tool="ensemble", metadata={...}) as store:
+            store.append(image_name, Detections.from_yolo(result, "Standard_Model", classes))
+    """
+
+    def __init__(self, root=EVIDENCE_STORE_DIR, tool="ensemble", run_id=None, metadata=None,
+                 flush_rows=FLUSH_ROWS, index=None, debug_log=False, cutoff=None):
+        self.root = root
+        self.index = index
+        self.tool = tool
+        self.run_id = run_id or new_run_id()
+        self.metadata = dict(metadata or {})
+        self.flush_rows = flush_rows
+        self.cutoff = cutoff  # Tool's visualize/official cutoff (None: every row is above)
+
+        self.run_dir = os.path.join(root, f"tool={tool}", f"run={self.run_id}")
+        os.makedirs(self.run_dir, exist_ok=True)
+        os.makedirs(os.path.join(root, RUNS_DIR), exist_ok=True)
+        self.debug = DebugLogWriter(self.run_dir) if debug_log else None
+
+        self.started = datetime.now()
+        self.n_rows = 0
+        self.n_images = 0
+        self._parts = 0
+        self._chunks = []  # One dict of NumPy columns per image
+        self._buffered = 0
+
+    def append(self, image, detections, timestamp=None, size=None):
+        """
+        Adds the detections of one image.
+
+        Args:
+            image: Image name (file name without extension).
+            detections: Detections (see detections.py).
+            timestamp: Analysis time (defaults to now).
+            size: Optional (width, height), recorded in the index.
+        """
+        timestamp = timestamp or datetime.now()
+        if self.cutoff is not None:
+            above = detections.conf > self.cutoff
+        else:
+            above = np.ones(len(detections), bool)
+        if self.debug is not None:
+            self.debug.append(image, detections, timestamp, above)
+            detections, above = detections[above], above[above]
+        if self.index is not None:
+            self.index.add_image(image, detections.to_rows(), self.tool, run_id=self.run_id, size=size,
+                                 analyzed=timestamp, cutoff=self.cutoff)
+
+        n = len(detections)
+        self.n_images += 1
+        self.n_rows += n
+        if not n:
+            return
+        self._chunks.append({
+            "timestamp": np.full(n, np.datetime64(timestamp, "us")),
+            "image": np.full(n, image, dtype=object),
+            "model_source": detections.source_names,
+            "object_type": detections.object_types,
+            "evidence_type": detections.labels,
+            "confidence": detections.conf,
+            "evidence_class": detections.evidence_class,
+            "above_cutoff": above,
+            "x1": detections.boxes[:, 0],
+            "y1": detections.boxes[:, 1],
+            "x2": detections.boxes[:, 2],
+            "y2": detections.boxes[:, 3],
+        })
+        self._buffered += n
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows as a new part file."""
+        if not self._buffered:
+            return
+        columns = {name: np.concatenate([chunk[name] for chunk in self._chunks]) for name in EVIDENCE_SCHEMA.names}
+        table = pa.Table.from_pydict(columns, schema=EVIDENCE_SCHEMA)
+        path = os.path.join(self.run_dir, f"part-{self._parts:05d}.parquet")
+        # Write under a temp name so readers never see a partial file
+        pq.write_table(table, path + ".tmp", compression="zstd")
+        os.replace(path + ".tmp", path)
+        self._parts += 1
+        self._chunks = []
+        self._buffered = 0
+
+    def close(self):
+        """Flushes and records the run metadata."""
+        self.flush()
+        if self.debug is not None:
+            self.debug.close()
+        run = {
+            "run_id": self.run_id,
+            "tool": self.tool,
+            "started": self.started.isoformat(),
+            "finished": datetime.now().isoformat(),
+            "images": self.n_images,
+            "rows": self.n_rows,
+            "parts": self._parts,
+            "debug_records": self.debug.n_records if self.debug is not None else None,
+            **self.metadata
+        }
+        with open(os.path.join(self.root, RUNS_DIR, f"{self.run_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2, default=str)
+        return run
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_dataset(root=EVIDENCE_STORE_DIR):
+    """Arrow dataset over every run (partition columns: tool, run)."""
+    # Only finished part files (not .tmp files being written, run metadata or debug logs)
+    parts = sorted(glob.glob(os.path.join(root, "tool=*", "run=*", "part-*.parquet")))
+    schema = pa.unify_schemas([EVIDENCE_SCHEMA, PARTITION_SCHEMA])
+    return ds.dataset(parts, schema=schema, format="parquet", partitioning=PARTITIONING,
+                      partition_base_dir=root)
+
+
+def load_evidence(root=EVIDENCE_STORE_DIR, columns=None, filter=None, tool=None, run=None):
+    """
+    Reads detections across images/runs into a DataFrame.
+
+    Only the requested columns are read, and partition/row-group filters
+    skip files that cannot match.
+
+    Args:
+        columns: Column names (default: all).
+        filter: Optional pyarrow expression, e.g.
+            (ds.field("evidence_type") == "Gun") & (ds.field("confidence") > 0.6)
+        tool, run: Restrict to one tool / run id.
+    """
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns or EVIDENCE_SCHEMA.names)
+    expr = filter
+    for name, value in (("tool", tool), ("run", run)):
+        if value is not None:
+            cond = ds.field(name) == value
+            expr = cond if expr is None else expr & cond
+    return open_dataset(root).to_table(columns=columns, filter=expr).to_pandas()
+
+
+def load_runs(root=EVIDENCE_STORE_DIR):
+    """Run metadata, newest first."""
+    runs_dir = os.path.join(root, RUNS_DIR)
+    if not os.path.isdir(runs_dir):
+        return []
+    runs = []
+    for name in os.listdir(runs_dir):
+        if name.endswith(".json"):
+            with open(os.path.join(runs_dir, name), encoding="utf-8") as f:
+                runs.append(json.load(f))
+    return sorted(runs, key=lambda r: r["started"], reverse=True)
+
+
+def load_run_rows(root=EVIDENCE_STORE_DIR, tool="ensemble", run=None):
+    """
+    All rows of a tool's runs: the Parquet rows, plus the below-cutoff rows
+    of the run's debug log if it has one. Rows above the cutoff always come
+    from Parquet (float32 confidences, the debug log only keeps float16).
+    """
+    frames = []
+    for info in load_runs(root):
+        if info["tool"] != tool or (run is not None and info["run_id"] != run):
+            continue
+        frames.append(load_evidence(root, tool=tool, run=info["run_id"]).drop(columns=["tool", "run"]))
+        run_dir = os.path.join(root, f"tool={tool}", f"run={info['run_id']}")
+        if has_debug_log(run_dir):
+            debug = DebugLog(run_dir).to_dataframe()
+            frames.append(debug[~debug["above_cutoff"]])
+    if not frames:
+        return pd.DataFrame(columns=EVIDENCE_SCHEMA.names)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _coords(df):
+    return [[int(a), int(b), int(c), int(d)] for a, b, c, d in zip(df["x1"], df["y1"], df["x2"], df["y2"])]
+
+
+def legacy_frames(df, tool):
+    """
+    Rebuilds the old per-image CSV tables from store rows.
+
+    Yields (file_suffix, image, DataFrame) in the exact column layout of
+    _FULL_REPORT.csv (ensemble) or _EVIDENCE.csv / _DEBUG.csv (yolo_marked).
+    """
+    for image, group in df.groupby("image", sort=True, observed=True):
+        # float32 -> the 6 significant digits it actually holds
+        conf = group["confidence"].astype(float).round(6)
+        timestamps = group["timestamp"].map(lambda t: t.isoformat())
+        if tool == "ensemble":
+            frame = pd.DataFrame({
+                "Timestamp": timestamps,
+                "Image": image,
+                "Model_Source": group["model_source"].astype(str),
+                "Evidence_Type": group["evidence_type"].astype(str),
+                "Confidence_Score": conf,
+                "Confidence_Text": [f"{c:.2%}" for c in conf],
+                "Visualized": ["YES" if v else "NO" for v in group["above_cutoff"]],
+                "Coords": _coords(group)
+            })
+            yield "_FULL_REPORT.csv", image, frame.sort_values(by="Confidence_Score", ascending=False)
+        else:
+            official = group[group["evidence_class"] & group["above_cutoff"]]
+            if len(official):
+                yield "_EVIDENCE.csv", image, pd.DataFrame({
+                    "Timestamp": official["timestamp"].map(lambda t: t.isoformat()),
+                    "Source_Image": image,
+                    "Evidence_Type": official["evidence_type"].astype(str),
+                    "Confidence": [f"{c:.2%}" for c in official["confidence"].astype(float)],
+                    "Location": _coords(official)
+                })
+            frame = pd.DataFrame({
+                "Source_Image": image,
+                "Object_Type": group["object_type"].astype(str),
+                "Confidence": conf,
+                "Is_Evidence_Class": group["evidence_class"].astype(bool),
+                "Box": _coords(group)
+            })
+            yield "_DEBUG.csv", image, frame.sort_values(by="Confidence", ascending=False)
+
+
+def export_csv(output_root, root=EVIDENCE_STORE_DIR, tool="ensemble", run=None):
+    """
+    Writes the legacy per-image CSV files for one tool (and optionally one run)
+    into the old folders under output_root (see LEGACY_SUBDIRS).
+    Returns the number of files written.
+    """
+    df = load_run_rows(root, tool=tool, run=run)
+    written = 0
+    for suffix, image, frame in legacy_frames(df, tool):
+        out_dir = os.path.join(output_root, LEGACY_SUBDIRS[suffix])
+        os.makedirs(out_dir, exist_ok=True)
+        frame.to_csv(os.path.join(out_dir, f"{image}{suffix}"), index=False)
+        written += 1
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar evidence store tools")
+    parser.add_argument("--root", default=EVIDENCE_STORE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("runs", help="List recorded runs")
+
+    export = sub.add_parser("export", help="Write the legacy per-image CSV files")
+    export.add_argument("output_root")
+    export.add_argument("--tool", default="ensemble", choices=["ensemble", "yolo_marked"])
+    export.add_argument("--run", default=None)
+
+    args = parser.parse_args()
+    if args.command == "runs":
+        for r in load_runs(args.root):
+            print(f"{r['run_id']}  {r['tool']:<12} {r['images']:>5} images  {r['rows']:>7} rows")
+    else:
+        n = export_csv(args.output_root, args.root, args.tool, args.run)
+        print(f"[EXPORT] Wrote {n} CSV files under '{args.output_root}/'")
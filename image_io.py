@@ -0,0 +1,214 @@
+import io
+import os
+import glob
+
+import cv2
+import numpy as np
+from PIL import Image
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+EXIF_ORIENTATION = 0x0112
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+MIN_IMAGE_BYTES = 128  # Smaller files are truncated/placeholder files
+MAX_IMAGE_BYTES = None  # Optional upper bound (bytes)
+IMAGE_NAME_SEP = "__"  # Joins subfolders in image names (see image_name)
+
+# JPEGs are scaled by 1/2, 1/4 or 1/8 inside the decoder (DCT scaling)
+REDUCED_DECODE_FLAGS = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+
+
+def decode_image_bytes(data):
+    """
+    Decodes an encoded image buffer (bytes/memoryview) straight to BGR.
+
+    cv2.IMREAD_COLOR applies the EXIF orientation, so the array is upright
+    and can be shared by detection, depth and export.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image data")
+    return img
+
+
+def image_size(source):
+    """
+    (width, height) of a path or encoded buffer as displayed (EXIF
+    orientation applied), read from the header only. None if unreadable.
+    """
+    try:
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as im:
+            w, h = im.size
+            if im.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+                w, h = h, w
+            return w, h
+    except Exception:
+        return None
+
+
+def reduction_factor(size, max_side):
+    """Largest decoder reduction (8, 4, 2 or 1) that keeps the long side >= max_side."""
+    if max_side is None or size is None:
+        return 1
+    for factor in REDUCED_DECODE_FLAGS:
+        if max(size) / factor >= max_side:
+            return factor
+    return 1
+
+
+def read_image(source, max_side=None):
+    """
+    Decodes a path or encoded buffer to BGR, at reduced resolution when
+    the original is much larger than max_side (None = full resolution).
+
+    Returns (img, scale, (orig_w, orig_h)) where scale = decoded / original
+    width, so Detections.from_yolo(..., scale=scale) gives boxes in original
+    pixels. img is None if the source cannot be decoded.
+    """
+    size = image_size(source)
+    factor = reduction_factor(size, max_side)
+    flag = REDUCED_DECODE_FLAGS.get(factor, cv2.IMREAD_COLOR)
+    if isinstance(source, str):
+        img = cv2.imread(source, flag)
+    else:
+        img = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), flag)
+    if img is None:
+        return None, 1.0, size
+    if size is None:
+        size = (img.shape[1], img.shape[0])
+    return img, img.shape[1] / size[0], size
+
+
+def get_exif_orientation(data):
+    """Returns the EXIF orientation tag (1 = upright) without decoding pixels."""
+    try:
+        return Image.open(io.BytesIO(data)).getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        return 1
+
+
+def reusable_mime(data):
+    """
+    Returns the mime type if the encoded bytes can be served as-is
+    (JPEG/PNG that is already upright), otherwise None.
+    """
+    head = bytes(data[:8])
+    if head.startswith(JPEG_MAGIC):
+        mime = "image/jpeg"
+    elif head.startswith(PNG_MAGIC):
+        mime = "image/png"
+    else:
+        return None
+
+    if get_exif_orientation(data) != 1:
+        return None
+    return mime
+
+
+def encode_for_export(img, data=None, ext=".jpg"):
+    """
+    Returns (bytes, mime) for an image that has to leave the process.
+
+    Re-uses the original upload bytes when possible and only encodes
+    the BGR array otherwise.
+    """
+    if data is not None:
+        mime = reusable_mime(data)
+        if mime is not None:
+            return bytes(data), mime
+
+    ok, buf = cv2.imencode(ext, img)
+    if not ok:
+        raise ValueError(f"Could not encode image as {ext}")
+    mime = "image/png" if ext == ".png" else "image/jpeg"
+    return buf.tobytes(), mime
+
+
+def sniff_image(head):
+    """True if the first bytes of a file are a known image signature."""
+    return (head.startswith(JPEG_MAGIC) or head.startswith(PNG_MAGIC) or head.startswith(b"BM")
+            or head.startswith((b"II*\x00", b"MM\x00*"))
+            or (head.startswith(b"RIFF") and head[8:12] == b"WEBP"))
+
+
+def _is_image_file(path, size, extensions, min_bytes, max_bytes):
+    if not path.lower().endswith(extensions):
+        return False
+    if size < min_bytes or (max_bytes is not None and size > max_bytes):
+        return False
+    try:
+        with open(path, "rb") as f:
+            return sniff_image(f.read(12))
+    except OSError:
+        return False
+
+
+def _walk(path, recursive, extensions, min_bytes, max_bytes, exclude):
+    """Sorted, depth-first walk of one directory (one listing in memory at a time)."""
+    if os.path.realpath(path) in exclude:
+        return
+    try:
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if recursive:
+                yield from _walk(entry.path, recursive, extensions, min_bytes, max_bytes, exclude)
+        elif entry.is_file() and _is_image_file(entry.path, entry.stat().st_size, extensions, min_bytes,
+                                                 max_bytes):
+            yield entry.path
+
+
+def input_root(source):
+    """The folder image names are relative to: source itself, or the part of a glob before its wildcards."""
+    root = source
+    while glob.has_magic(root) or (root and not os.path.isdir(root)):
+        root = os.path.dirname(root)
+    return root or "."
+
+
+def image_name(path, root=None):
+    """
+    Name of an image in logs and output files: its path relative to root
+    without the extension, folders joined by IMAGE_NAME_SEP
+    ('roomA/IMG_0001.jpg' -> 'roomA__IMG_0001'). Same-named photos from
+    different subfolders (the usual case for camera file names) stay apart.
+    """
+    rel = os.path.relpath(path, root) if root is not None else os.path.basename(path)
+    if rel.startswith(os.pardir):  # Not under root
+        rel = os.path.basename(path)
+    return IMAGE_NAME_SEP.join(os.path.normpath(os.path.splitext(rel)[0]).split(os.sep))
+
+
+def iter_images(source, recursive=True, extensions=IMAGE_EXTENSIONS, min_bytes=MIN_IMAGE_BYTES,
+                max_bytes=MAX_IMAGE_BYTES, exclude=()):
+    """
+    Lazily yields image paths under a directory or glob pattern
+    (e.g. "crime_scenes" or "crime_scenes/*"), in a deterministic order.
+
+    Files are filtered by extension, size and magic bytes, so nothing is
+    handed to the decoder that is not an image. Matched directories are
+    walked (recursively unless recursive=False); hidden entries and the
+    directories in exclude (e.g. the run's own output folder) are skipped.
+    """
+    exclude = {os.path.realpath(p) for p in exclude}
+    if os.path.isdir(source):
+        yield from _walk(source, recursive, extensions, min_bytes, max_bytes, exclude)
+        return
+    # Only the pattern's own matches are sorted up front; directories are walked lazily
+    for path in sorted(glob.iglob(source, recursive=True)):
+        if os.path.isdir(path):
+            if recursive:
+                yield from _walk(path, recursive, extensions, min_bytes, max_bytes, exclude)
+        elif os.path.realpath(os.path.dirname(path)) in exclude:
+            continue
+        elif os.path.isfile(path) and _is_image_file(path, os.path.getsize(path), extensions, min_bytes,
+                                                     max_bytes):
+            yield path
@@ -0,0 +1,123 @@
+import cv2
+
+# Default Color Palette (BGR) - same as the ensemble detectors
+DEFAULT_COLORS = {
+    "biohazard": (0, 0, 139),
+    "weapon_gun": (0, 0, 255),
+    "weapon_knife": (0, 69, 255),
+    "person": (255, 255, 0),
+    "digital": (255, 0, 0),
+    "general": (0, 255, 255),
+    "text": (255, 255, 255),
+    "bg_label": (50, 50, 50)
+}
+
+
+def get_label_color(label, colors=DEFAULT_COLORS):
+    """Pick the box color for an evidence label."""
+    if "Blood" in label:
+        return colors["biohazard"]
+    elif "Gun" in label:
+        return colors["weapon_gun"]
+    elif "Knife" in label:
+        return colors["weapon_knife"]
+    elif "Person" in label:
+        return colors["person"]
+    elif "Phone" in label or "Laptop" in label:
+        return colors["digital"]
+    return colors["general"]
+
+
+def build_overlay(detections, img_w, img_h, cutoff=0.30, colors=DEFAULT_COLORS):
+    """
+    Builds a sparse annotation overlay from detections.
+
+    The overlay only holds the boxes and labels (in original image pixels),
+    never the image itself. It is drawn onto a frame by composite_overlay()
+    at display/export time, so re-filtering or exporting at another size
+    does not copy or redraw the full-resolution analysis result.
+
+    Args:
+        detections: Detections (see detections.py).
+        img_w, img_h: Size of the image the coordinates refer to.
+        cutoff: Only rows above this confidence are kept.
+        colors: Color palette (BGR).
+    Returns:
+        overlay (dict): {"size": (w, h), "colors": ..., "items": [...]}
+    """
+    items = detections.above(cutoff).items()
+    for item in items:
+        item["Color"] = get_label_color(item["Label"], colors)
+
+    return {"size": (img_w, img_h), "colors": colors, "items": items}
+
+
+def filter_overlay(overlay, labels=None, min_conf=None):
+    """Returns a new overlay restricted to the given labels / confidence."""
+    items = overlay["items"]
+    if labels is not None:
+        labels = set(labels)
+        items = [it for it in items if it["Label"] in labels]
+    if min_conf is not None:
+        items = [it for it in items if it["Conf"] > min_conf]
+    return {"size": overlay["size"], "colors": overlay["colors"], "items": items}
+
+
+def composite_overlay(img, overlay, font_scale=0.8, thickness=2, box_thickness=3, in_place=False):
+    """
+    Draws the overlay onto an image (BGR).
+
+    The target image may be a resized version of the original; box
+    coordinates are rescaled to its size. The input is copied unless
+    in_place=True.
+    """
+    out = img if in_place else img.copy()
+    if not overlay["items"]:
+        return out
+
+    out_h, out_w = out.shape[:2]
+    src_w, src_h = overlay["size"]
+    sx = out_w / src_w
+    sy = out_h / src_h
+    colors = overlay["colors"]
+
+    for item in overlay["items"]:
+        x1, y1, x2, y2 = item["Box"]
+        x1, x2 = int(x1 * sx), int(x2 * sx)
+        y1, y2 = int(y1 * sy), int(y2 * sy)
+
+        # Draw Box
+        cv2.rectangle(out, (x1, y1), (x2, y2), item["Color"], box_thickness)
+
+        # --- BOUNDARY AWARE LABEL DRAWING ---
+        lbl = f"{item['Label']} {item['Conf']:.0%}"
+        (text_w, text_h), baseline = cv2.getTextSize(lbl, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+
+        # Default: Draw ABOVE the box
+        bg_x1 = x1
+        bg_y1 = y1 - text_h - 10
+        bg_x2 = x1 + text_w + 10
+        bg_y2 = y1
+        text_x = x1 + 5
+        text_y = y1 - 5
+
+        # Boundary checks
+        if y1 - text_h - 10 < 0:
+            bg_y1 = y1
+            bg_y2 = y1 + text_h + 10
+            text_y = y1 + text_h + 5
+
+        if x1 + text_w + 10 > out_w:
+            shift_amount = (x1 + text_w + 10) - out_w
+            bg_x1 -= shift_amount
+            bg_x2 -= shift_amount
+            text_x -= shift_amount
+
+        # Draw Label Background
+        cv2.rectangle(out, (bg_x1, bg_y1), (bg_x2, bg_y2), colors["bg_label"], -1)
+
+        # Draw Text
+        cv2.putText(out, lbl, (text_x, text_y),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, colors["text"], thickness)
+
+    return out
@@ -0,0 +1,190 @@
+import os
+import itertools
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+# --- CONFIGURATION ---
+SESSION_MAX_BYTES = 64 * 1024 * 1024  # Per investigator session
+SESSION_MAX_RESULTS = 50  # Room for a batch of scene photos
+GLOBAL_MAX_BYTES = 512 * 1024 * 1024  # Whole server process
+IMAGE_FORMAT = ".jpg"  # or ".webp"
+IMAGE_QUALITY = 90
+
+# Every live store, so the global cap can evict across sessions
+_STORES = weakref.WeakSet()
+_LOCK = threading.RLock()
+_SEQ = itertools.count()
+
+
+class StoredResult:
+    """
+    One analysis result held as compressed bytes.
+
+    The frame is kept as JPEG/WebP, detections as typed NumPy columns and
+    the VR HTML as zlib bytes. Everything is decoded lazily on access.
+    """
+    __slots__ = ("seq", "timestamp", "image_bytes", "overlay", "detections",
+                 "visual_cutoff", "vr_bytes", "vr_entry", "nbytes")
+
+    def __init__(self, img, overlay, detections, visual_cutoff=0.30, image_bytes=None):
+        self.seq = next(_SEQ)
+        self.timestamp = datetime.now().isoformat()
+
+        # 1. Image -> compressed bytes (re-use an already encoded upload)
+        if image_bytes is None:
+            if IMAGE_FORMAT == ".webp":
+                params = [cv2.IMWRITE_WEBP_QUALITY, IMAGE_QUALITY]
+            else:
+                params = [cv2.IMWRITE_JPEG_QUALITY, IMAGE_QUALITY]
+            ok, buf = cv2.imencode(IMAGE_FORMAT, img, params)
+            if not ok:
+                raise ValueError(f"Could not encode result image as {IMAGE_FORMAT}")
+            image_bytes = buf.tobytes()
+        self.image_bytes = bytes(image_bytes)
+        self.overlay = overlay
+
+        # 2. Detections are already columnar (labels/sources as small integer codes)
+        self.detections = detections
+        self.visual_cutoff = visual_cutoff
+
+        self.vr_bytes = None
+        self.vr_entry = None
+        self._update_size()
+
+    def _update_size(self):
+        self.nbytes = (len(self.image_bytes) + self.detections.nbytes + len(self.vr_bytes or b"")
+                       + len((self.vr_entry or {}).get("Evidence", ""))
+                       + 64 * len(self.overlay["items"]))
+
+    @property
+    def image(self):
+        """Decoded BGR frame."""
+        return cv2.imdecode(np.frombuffer(self.image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+    @property
+    def vr_html(self):
+        if self.vr_bytes is None:
+            return None
+        return zlib.decompress(self.vr_bytes).decode("utf-8")
+
+    def set_vr_html(self, html, entry=None):
+        """entry: Optional vr_utils.make_gallery_entry() for the case gallery."""
+        self.vr_bytes = zlib.compress(html.encode("utf-8"), 6)
+        self.vr_entry = entry
+        self._update_size()
+
+    def vr_assets_present(self):
+        """False if a texture/mesh file the VR scene references is gone (evicted from disk)."""
+        if self.vr_entry is None:
+            return True
+        paths = (self.vr_entry.get(key) for key in ("Image", "Depth", "Mesh"))
+        return all(os.path.exists(p) for p in paths if p is not None and not p.startswith("data:"))
+
+    def clear_vr(self):
+        self.vr_bytes = None
+        self.vr_entry = None
+        self._update_size()
+
+    def __len__(self):
+        return len(self.detections)
+
+    def to_dataframe(self):
+        """Rebuilds the report table (same columns as the CSV export)."""
+        return self.detections.to_dataframe(self.timestamp, self.visual_cutoff)
+
+
+class SessionResultStore:
+    """
+    Per-session container for analysis results.
+
+    Results are evicted oldest-first when the session goes over
+    SESSION_MAX_RESULTS / SESSION_MAX_BYTES, and across all sessions when
+    the process goes over GLOBAL_MAX_BYTES.
+    """
+
+    def __init__(self, max_bytes=SESSION_MAX_BYTES, max_results=SESSION_MAX_RESULTS):
+        self.max_bytes = max_bytes
+        self.max_results = max_results
+        self._results = OrderedDict()
+        with _LOCK:
+            _STORES.add(self)
+
+    @property
+    def nbytes(self):
+        return sum(r.nbytes for r in self._results.values())
+
+    def add(self, img, overlay, detections, visual_cutoff=0.30, image_bytes=None):
+        """
+        Compresses and stores a result, returns its id.
+
+        image_bytes: Optional JPEG/WebP encoding of img to store as-is.
+        """
+        result = StoredResult(img, overlay, detections, visual_cutoff, image_bytes)
+        with _LOCK:
+            self._results[result.seq] = result
+            self._evict_session()
+            _evict_global()
+        return result.seq
+
+    def get(self, result_id):
+        """Returns the StoredResult, or None if it was evicted."""
+        return self._results.get(result_id)
+
+    def set_vr_html(self, result_id, html, entry=None):
+        result = self.get(result_id)
+        if result is None:
+            return
+        with _LOCK:
+            result.set_vr_html(html, entry)
+            self._evict_session()
+            _evict_global()
+
+    def drop_missing_vr(self):
+        """
+        Forgets the VR scenes whose asset files were evicted from disk
+        (vr_utils.evict_assets), so they are rebuilt instead of rendering
+        without textures. Returns the number of scenes dropped.
+        """
+        dropped = 0
+        with _LOCK:
+            for result in list(self._results.values()):
+                if result.vr_bytes is not None and not result.vr_assets_present():
+                    result.clear_vr()
+                    dropped += 1
+        return dropped
+
+    def vr_entries(self):
+        """Gallery entries of all results with a VR scene, oldest first."""
+        return [r.vr_entry for r in list(self._results.values()) if r.vr_entry is not None]
+
+    def _evict_session(self):
+        # Never evict the newest result, even if it alone is over the cap
+        while len(self._results) > 1 and (len(self._results) > self.max_results
+                                          or self.nbytes > self.max_bytes):
+            self._results.popitem(last=False)
+
+
+def _evict_global():
+    """Drops the oldest results across all sessions until under the cap."""
+    stores = list(_STORES)
+    total = sum(s.nbytes for s in stores)
+    while total > GLOBAL_MAX_BYTES:
+        candidates = [(next(iter(s._results.values())), s) for s in stores if len(s._results) > 1]
+        if not candidates:
+            break
+        oldest, owner = min(candidates, key=lambda c: c[0].seq)
+        del owner._results[oldest.seq]
+        total -= oldest.nbytes
+
+
+def global_usage():
+    """Returns (total_bytes, n_results) held by all sessions."""
+    with _LOCK:
+        stores = list(_STORES)
+        return sum(s.nbytes for s in stores), sum(len(s._results) for s in stores)
@@ -1,67 +1,454 @@
 
 import os
+import html
+import json
+import math
+import bisect
+import shutil
+import struct
+import hashlib
+import urllib.request
+import cv2
 import numpy as np
 
-def create_aframe_scene(detections, image_path, depth_path, depth_array, img_w, img_h, output_file):
+# 3D World Config
+WALL_Z = -4.0 # Moved back slightly to accommodate larger size
+WALL_WIDTH = 12.0 # Increased from 4.0 to 12.0
+# Center of wall
+WALL_X = 0
+WALL_Y = 1.6
+# Displacement Config
+DISPLACEMENT_SCALE = 3.5 # Increased from 1.5 to match scale
+
+# Mesh resolution of the displaced evidence wall (segments per side)
+VR_MESH_SEGMENTS = 128
+# Baked mesh: quadtree cells whose depth range is below this (0-1 units)
+# are kept as a single quad
+MESH_FLAT_TOLERANCE = 0.02
+
+# Offline bundle of the A-Frame runtime, components, fonts and textures.
+# Fetch it once on a connected machine with `python vr_utils.py --fetch-vendor`
+# and copy the folder to air-gapped workstations.
+VR_VENDOR_DIR = os.path.join("static", "vendor")
+VR_VENDOR_ASSETS = {
+    "aframe.min.js": "https://aframe.io/releases/1.4.0/aframe.min.js",
+    "aframe-look-at-component.min.js": "https://unpkg.com/aframe-look-at-component@0.8.0/dist/aframe-look-at-component.min.js",
+    "Orbitron-Black.json": "https://raw.githubusercontent.com/etiennepinchon/aframe-fonts/master/fonts/orbitron/Orbitron-Black.json",
+    "Orbitron-Black.png": "https://raw.githubusercontent.com/etiennepinchon/aframe-fonts/master/fonts/orbitron/Orbitron-Black.png",
+    "Roboto-msdf.json": "https://cdn.aframe.io/fonts/Roboto-msdf.json",
+    "Roboto-msdf.png": "https://cdn.aframe.io/fonts/Roboto-msdf.png",
+    "floor.jpg": "https://cdn.aframe.io/a-painter/images/floor.jpg",
+}
+# Scripts of the bundle, in load order
+VR_VENDOR_SCRIPTS = ("aframe.min.js", "aframe-look-at-component.min.js")
+
+# Label collision window (3D units)
+LABEL_HEIGHT = 0.3 # Estimated height of a label in 3D units
+LABEL_MIN_DX = 0.5 # Labels closer than this horizontally can overlap
+
+
+class LabelGrid:
     """
-    Generates a Full 3D A-Frame scene using Displacement Maps.
-    
-    Args:
-        detections: List of dicts with Box, Label, Conf.
-        image_path: Path/DataURI to the RGB image.
-        depth_path: Path/DataURI to the Depth map image.
-        depth_array: Numpy array of depth values (normalized 0-255 or 0-1).
-        img_w, img_h: Dimensions.
-        output_file: Output path.
+    Placed labels for collision avoidance, kept per column.
+
+    Columns are half a collision window (min_dx / 2) wide. Every label in
+    the columns next to a label's own one overlaps it horizontally, so each
+    column keeps the merged y intervals blocked by the labels of itself and
+    its two neighbours: a whole stack of labels is skipped with one bisect.
+    Only the columns two away need a per-label check.
+
+    Slots are y0 + k * min_dy, and labels exactly one step apart (up to
+    float noise, EPS) do not collide, so a stack stays one interval.
     """
-    
-    # 3D World Config
-    WALL_Z = -4.0 # Moved back slightly to accommodate larger size
-    WALL_WIDTH = 12.0 # Increased from 4.0 to 12.0
-    aspect_ratio = img_h / img_w
-    WALL_HEIGHT = WALL_WIDTH * aspect_ratio
-    
-    # Center of wall
-    WALL_X = 0
-    WALL_Y = 1.6
-    
-    X_min = WALL_X - (WALL_WIDTH / 2)
-    Y_max = WALL_Y + (WALL_HEIGHT / 2)
-    
-    # Displacement Config
-    DISPLACEMENT_SCALE = 3.5 # Increased from 1.5 to match scale
-    
-    scene_objects = []
-    
-    # Resolve Paths
-    if image_path.startswith("data:"): rel_image_path = image_path
-    else: rel_image_path = os.path.basename(image_path)
-        
-    if depth_path.startswith("data:"): rel_depth_path = depth_path
-    else: rel_depth_path = os.path.basename(depth_path)
-    
+
+    EPS = 1e-9
+
+    def __init__(self, min_dx=LABEL_MIN_DX, min_dy=LABEL_HEIGHT):
+        self.min_dx = min_dx
+        self.min_dy = min_dy
+        self.reach = min_dy - self.EPS  # Vertical distance below which labels collide
+        self.width = min_dx / 2
+        self.columns = {}  # column -> ([y], [x]) sorted by y
+        self.blocked = {}  # column -> ([start], [end]) merged intervals of columns -1..+1
+
+    def _colliding_top(self, col, x, y):
+        """Highest Y of the labels colliding with (x, y), or None."""
+        top = None
+        for c in range(col - 2, col + 3):
+            ys, xs = self.columns.get(c, ((), ()))
+            lo = bisect.bisect_right(ys, y - self.min_dy)
+            hi = bisect.bisect_left(ys, y + self.min_dy)
+            for i in range(lo, hi):
+                if abs(x - xs[i]) < self.min_dx and abs(y - ys[i]) < self.reach:
+                    if top is None or ys[i] > top:
+                        top = ys[i]
+        return top
+
+    def _blocked_end(self, col, y):
+        """End of the merged interval of column col containing y, or None."""
+        starts, ends = self.blocked.get(col, ((), ()))
+        i = bisect.bisect_right(starts, y) - 1
+        if i >= 0 and y < ends[i]:
+            return ends[i]
+        return None
+
+    def _block(self, col, y):
+        """Merges (y - reach, y + reach) into the intervals of column col."""
+        starts, ends = self.blocked.setdefault(col, ([], []))
+        start, end = y - self.reach, y + self.reach
+        lo = bisect.bisect_right(ends, start)
+        hi = bisect.bisect_left(starts, end)
+        if lo < hi:
+            start, end = min(start, starts[lo]), max(end, ends[hi - 1])
+        starts[lo:hi] = [start]
+        ends[lo:hi] = [end]
+
+    def place(self, x, y):
+        """Moves y up in min_dy steps until it is clear, records and returns it."""
+        col = math.floor(x / self.width)
+        y0, k = y, 0
+        while True:
+            top = self._colliding_top(col, x, y)
+            if top is None:
+                break
+            # Every step still within reach of that label, or of the stack
+            # it belongs to, collides anyway, so skip them without re-checking
+            end = max(top + self.reach, self._blocked_end(col, top) or top)
+            k = max(k + 1, math.ceil((end - y0) / self.min_dy))
+            while y0 + k * self.min_dy < end:
+                k += 1
+            y = y0 + k * self.min_dy
+
+        ys, xs = self.columns.setdefault(col, ([], []))
+        i = bisect.bisect_left(ys, y)
+        ys.insert(i, y)
+        xs.insert(i, x)
+        for c in (col - 1, col, col + 1):
+            self._block(c, y)
+        return y
+
+
+def make_displacement_map(depth_array, segments=VR_MESH_SEGMENTS):
+    """
+    Resamples a depth map to the plane's vertex grid ((segments + 1)^2)
+    and quantizes it to 8-bit. The browser only samples one texel per
+    vertex, so anything bigger is decoded for nothing.
+    Returns:
+        PNG bytes.
+    """
+    if depth_array.dtype != np.uint8:
+        d_max = float(depth_array.max())
+        scale = 255.0 / d_max if d_max > 0 else 0.0
+        depth_array = np.clip(depth_array * scale, 0, 255).astype(np.uint8)
+
+    grid = segments + 1
+    small = cv2.resize(depth_array, (grid, grid), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".png", small, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+    if not ok:
+        raise ValueError("Could not encode displacement map")
+    return buf.tobytes()
+
+
+def check_vendor_assets(vendor_dir=VR_VENDOR_DIR):
+    """Raises FileNotFoundError if any file of the offline A-Frame bundle is missing."""
+    missing = [name for name in VR_VENDOR_ASSETS
+               if not os.path.isfile(os.path.join(vendor_dir, name))
+               or os.path.getsize(os.path.join(vendor_dir, name)) == 0]
+    if missing:
+        raise FileNotFoundError(
+            f"VR vendor bundle incomplete in '{vendor_dir}', missing: {', '.join(missing)}. "
+            f"Run `python vr_utils.py --fetch-vendor` on a connected machine and copy the folder over."
+        )
+
+
+def _vendor_script_tags(vendor_url):
+    return "\n    ".join(f'<script src="{vendor_url}{name}"></script>' for name in VR_VENDOR_SCRIPTS)
+
+
+def fetch_vendor_assets(vendor_dir=VR_VENDOR_DIR):
+    """Downloads the offline A-Frame bundle (needs network access)."""
+    os.makedirs(vendor_dir, exist_ok=True)
+    for name, url in VR_VENDOR_ASSETS.items():
+        path = os.path.join(vendor_dir, name)
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            continue
+        print(f"[VR] Fetching {url}...")
+        with urllib.request.urlopen(url, timeout=60) as resp, open(path + ".tmp", "wb") as f:
+            shutil.copyfileobj(resp, f)
+        os.replace(path + ".tmp", path)
+    check_vendor_assets(vendor_dir)
+
+
+def install_vendor_assets(dest_dir, vendor_dir=VR_VENDOR_DIR):
+    """
+    Copies the offline bundle next to generated scenes ('<dest_dir>/vendor/')
+    once, so every scene in the folder shares it. Returns the folder path.
+    """
+    check_vendor_assets(vendor_dir)
+    target = os.path.join(dest_dir, "vendor")
+    os.makedirs(target, exist_ok=True)
+    for name in VR_VENDOR_ASSETS:
+        src_path = os.path.join(vendor_dir, name)
+        dst_path = os.path.join(target, name)
+        if not os.path.exists(dst_path) or os.path.getsize(dst_path) != os.path.getsize(src_path):
+            shutil.copyfile(src_path, dst_path)
+    return target
+
+
+def write_asset(data, ext, asset_dir, max_bytes=None):
+    """
+    Writes bytes to asset_dir under a content hash name (once).
+    With max_bytes, least recently written/reused assets are removed
+    until the folder fits (the new asset is always kept).
+    Returns the file path.
+    """
+    os.makedirs(asset_dir, exist_ok=True)
+    name = hashlib.sha1(data).hexdigest()[:20] + ext
+    path = os.path.join(asset_dir, name)
+    if os.path.exists(path):
+        # Touch so eviction is least-recently-used
+        os.utime(path)
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+    if max_bytes is not None:
+        evict_assets(asset_dir, max_bytes, keep=(path,))
+    return path
+
+
+def evict_assets(asset_dir, max_bytes, keep=()):
+    """Removes least recently used files until asset_dir fits max_bytes."""
+    entries = []
+    for name in os.listdir(asset_dir):
+        path = os.path.join(asset_dir, name)
+        if path in keep:
+            continue
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(e[1] for e in entries) + sum(os.path.getsize(p) for p in keep if os.path.exists(p))
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _relative_url(path, output_file):
+    """URL of a local file relative to the HTML file that references it."""
+    rel = os.path.relpath(path, os.path.dirname(os.path.abspath(output_file)) or ".")
+    return rel.replace(os.sep, "/")
+
+
+def _asset_src(path, output_file, asset_base_url):
+    """Data URI as-is, published asset by URL, or a path relative to the HTML."""
+    if path.startswith("data:"): return path
+    if asset_base_url: return asset_base_url + os.path.basename(path)
+    return _relative_url(os.path.abspath(path), output_file)
+
+
+def _depth_to_unit(depth_array):
+    """Depth values as 0-1 floats, the way the displacement map is read (texel / 255)."""
+    if depth_array.dtype == np.uint8:
+        return depth_array.astype(np.float32) / 255.0
+    d_max = float(depth_array.max())
+    return depth_array.astype(np.float32) / d_max if d_max > 0 else np.zeros(depth_array.shape, np.float32)
+
+
+def build_depth_mesh(depth_array, width, height, displacement_scale=DISPLACEMENT_SCALE,
+                     segments=VR_MESH_SEGMENTS, tolerance=MESH_FLAT_TOLERANCE):
+    """
+    Triangulates a depth map into an adaptive mesh.
+
+    The depth is resampled to a (segments + 1)^2 lattice and split with a
+    quadtree: cells whose depth range is within `tolerance` stay one quad,
+    cells crossing depth edges are refined down to single lattice cells.
+    Larger cells are fanned around their center through every vertex on
+    their border, so there are no cracks next to finer neighbours.
+
+    Returns:
+        positions (N, 3) float32, uvs (N, 2) float32, indices (M,) uint32
+        in a plane centered on the origin, facing +Z.
+    """
+    levels = max(1, int(round(math.log2(segments))))
+    n = 2 ** levels
+    grid = cv2.resize(_depth_to_unit(depth_array), (n + 1, n + 1), interpolation=cv2.INTER_AREA)
+
+    # 1. Quadtree split
+    leaves = []
+    stack = [(0, 0, n)]
+    while stack:
+        x0, y0, size = stack.pop()
+        cell = grid[y0:y0 + size + 1, x0:x0 + size + 1]
+        if size > 1 and float(cell.max() - cell.min()) > tolerance:
+            half = size // 2
+            stack.extend([(x0, y0, half), (x0 + half, y0, half),
+                          (x0, y0 + half, half), (x0 + half, y0 + half, half)])
+        else:
+            leaves.append((x0, y0, size))
+
+    used = np.zeros((n + 1, n + 1), dtype=bool)
+    for x0, y0, size in leaves:
+        used[y0, x0] = used[y0, x0 + size] = used[y0 + size, x0] = used[y0 + size, x0 + size] = True
+
+    # 2. Triangulate (counter-clockwise seen from +Z, image rows go down)
+    vertex_ids = {}
+    triangles = []
+
+    def vid(x, y):
+        key = (x, y)
+        if key not in vertex_ids:
+            vertex_ids[key] = len(vertex_ids)
+        return vertex_ids[key]
+
+    for x0, y0, size in leaves:
+        x1, y1 = x0 + size, y0 + size
+        # Border walk: left edge down, bottom edge right, right edge up, top edge left
+        border = [(x0, y) for y in range(y0, y1) if used[y, x0]]
+        border += [(x, y1) for x in range(x0, x1) if used[y1, x]]
+        border += [(x1, y) for y in range(y1, y0, -1) if used[y, x1]]
+        border += [(x, y0) for x in range(x1, x0, -1) if used[y0, x]]
+        ids = [vid(x, y) for x, y in border]
+
+        if len(ids) == 4:
+            triangles.append((ids[0], ids[1], ids[2]))
+            triangles.append((ids[0], ids[2], ids[3]))
+        else:
+            center = vid(x0 + size // 2, y0 + size // 2)
+            for i in range(len(ids)):
+                triangles.append((center, ids[i], ids[(i + 1) % len(ids)]))
+
+    lattice = np.array(list(vertex_ids.keys()), dtype=np.int32).reshape(-1, 2)
+    u = lattice[:, 0] / n
+    v = lattice[:, 1] / n
+    positions = np.stack([(u - 0.5) * width,
+                          (0.5 - v) * height,
+                          grid[lattice[:, 1], lattice[:, 0]] * displacement_scale], axis=1).astype(np.float32)
+    uvs = np.stack([u, v], axis=1).astype(np.float32)
+    indices = np.array(triangles, dtype=np.uint32).reshape(-1)
+    return positions, uvs, indices
+
+
+def _pad4(data, fill=b"\x00"):
+    return data + fill * (-len(data) % 4)
+
+
+def build_depth_glb(depth_array, image_bytes, img_w, img_h, image_mime="image/jpeg",
+                    segments=VR_MESH_SEGMENTS, tolerance=MESH_FLAT_TOLERANCE):
+    """
+    Bakes the displaced evidence wall into a binary glTF (.glb) with the
+    photo embedded as its texture. Same size and displacement as the
+    A-Frame plane, so it can replace it in create_aframe_scene(mesh_path=...).
+
+    Returns:
+        (glb bytes, stats dict with Vertices / Triangles)
+    """
+    wall_height = WALL_WIDTH * (img_h / img_w)
+    positions, uvs, indices = build_depth_mesh(depth_array, WALL_WIDTH, wall_height,
+                                               segments=segments, tolerance=tolerance)
+
+    index_type, index_component = (np.uint16, 5123) if len(positions) < 65536 else (np.uint32, 5125)
+    blobs = [positions.tobytes(), uvs.tobytes(), indices.astype(index_type).tobytes(), bytes(image_bytes)]
+    targets = [34962, 34962, 34963, None]
+
+    binary = b""
+    buffer_views = []
+    for blob, target in zip(blobs, targets):
+        view = {"buffer": 0, "byteOffset": len(binary), "byteLength": len(blob)}
+        if target is not None:
+            view["target"] = target
+        buffer_views.append(view)
+        binary += _pad4(blob)
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "crime-scene-analyzer vr_utils"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "name": "evidence_wall"}],
+        "meshes": [{"primitives": [{
+            "attributes": {"POSITION": 0, "TEXCOORD_0": 1},
+            "indices": 2,
+            "material": 0
+        }]}],
+        "materials": [{
+            "pbrMetallicRoughness": {"baseColorTexture": {"index": 0}, "metallicFactor": 0.0, "roughnessFactor": 1.0},
+            "doubleSided": True
+        }],
+        "textures": [{"source": 0, "sampler": 0}],
+        "samplers": [{"magFilter": 9729, "minFilter": 9987}],
+        "images": [{"bufferView": 3, "mimeType": image_mime}],
+        "accessors": [
+            {"bufferView": 0, "componentType": 5126, "count": len(positions), "type": "VEC3",
+             "min": positions.min(axis=0).tolist(), "max": positions.max(axis=0).tolist()},
+            {"bufferView": 1, "componentType": 5126, "count": len(uvs), "type": "VEC2"},
+            {"bufferView": 2, "componentType": index_component, "count": len(indices), "type": "SCALAR"}
+        ],
+        "bufferViews": buffer_views,
+        "buffers": [{"byteLength": len(binary)}]
+    }
+
+    json_chunk = _pad4(json.dumps(gltf, separators=(",", ":")).encode("utf-8"), b" ")
+    total = 12 + 8 + len(json_chunk) + 8 + len(binary)
+    glb = (struct.pack("<4sII", b"glTF", 2, total)
+           + struct.pack("<I4s", len(json_chunk), b"JSON") + json_chunk
+           + struct.pack("<I4s", len(binary), b"BIN\x00") + binary)
+
+    stats = {"Vertices": len(positions), "Triangles": len(indices) // 3,
+             "Full_Triangles": 2 * segments * segments}
+    return glb, stats
+
+
+def _wall_entity(image_src, depth_src, mesh_src, img_w, img_h, segments=VR_MESH_SEGMENTS):
+    """HTML of the textured evidence wall (displaced plane or pre-baked mesh)."""
     # --- PROJECTION LOGIC ---
     # The depth map in A-Frame pushes geometry along the normal (Z+ relative to plane)
     # The plane is at WALL_Z.
     # Displacement moves vertices towards camera (if facing camera).
     # New Z = WALL_Z + (PixelValueNormalized * DISPLACEMENT_SCALE)
-    
+    if mesh_src is not None:
+        # Pre-baked mesh: geometry and texture come from the .glb
+        return f"""
+        <a-entity id="evidence-wall"
+            gltf-model="url({mesh_src})"
+            position="{WALL_X} {WALL_Y} {WALL_Z}">
+        </a-entity>
+    """
+
+    wall_height = WALL_WIDTH * (img_h / img_w)
     # Add the 3D Plane
     # segments-width/height determines the mesh resolution (poly count)
-    scene_objects.append(f"""
+    return f"""
         <a-plane 
-            src="{rel_image_path}" 
-            displacement-map="{rel_depth_path}"
+            src="{image_src}" 
+            displacement-map="{depth_src}"
             displacement-scale="{DISPLACEMENT_SCALE}"
             displacement-bias="0"
             position="{WALL_X} {WALL_Y} {WALL_Z}" 
             width="{WALL_WIDTH}" 
-            height="{WALL_HEIGHT}"
-            segments-width="128" 
-            segments-height="128"
+            height="{wall_height}"
+            segments-width="{segments}" 
+            segments-height="{segments}"
             material="shader: standard; roughness: 1; metalness: 0; side: double">
         </a-plane>
-    """)
+    """
+
+
+def _evidence_entities(detections, depth_array, img_w, img_h, vendor_url="vendor/"):
+    """HTML of the floating evidence boxes and labels, placed on the depth surface."""
+    # 3D World Config (see module constants)
+    aspect_ratio = img_h / img_w
+    WALL_HEIGHT = WALL_WIDTH * aspect_ratio
+    
+    X_min = WALL_X - (WALL_WIDTH / 2)
+    Y_max = WALL_Y + (WALL_HEIGHT / 2)
+    
+    scene_objects = []
     
     # Normalize depth array to 0-1 for calculation if it isn't already
     if depth_array.max() > 1.0:
@@ -73,11 +460,12 @@ def create_aframe_scene(detections, image_path, depth_path, depth_array, img_w,
             norm_depth = (depth_array - d_min) / (d_max - d_min)
     else:
         norm_depth = depth_array
+    
+    # The depth map may be at a lower working resolution than the image
+    depth_h, depth_w = norm_depth.shape[:2]
 
-    # Store placed label positions to check for collisions: (x, y, z)
-    placed_labels = []
-    LABEL_HEIGHT = 0.3 # Estimated height of a label in 3D units
-    MIN_DIST = 0.4 # Minimum distance between labels
+    # Placed label positions, hashed on a grid to check for collisions
+    label_grid = LabelGrid()
 
     # Sort detections by Y (bottom to top) so we stack upwards? 
     # Or just process them order. Let's process in order but check collisions.
@@ -103,8 +491,8 @@ def create_aframe_scene(detections, image_path, depth_path, depth_array, img_w,
         h3d = nh * WALL_HEIGHT
         
         # 2. Calculate Z-Depth from Depth Map
-        py = int(ncy * (img_h - 1))
-        px = int(ncx * (img_w - 1))
+        py = int(ncy * (depth_h - 1))
+        px = int(ncx * (depth_w - 1))
         
         try:
             depth_val = norm_depth[py, px]
@@ -123,25 +511,9 @@ def create_aframe_scene(detections, image_path, depth_path, depth_array, img_w,
         # Global position would be: cx3d_base, cy3d_base + h3d/2 + 0.2, z_pos
         base_label_y = cy3d_base + (h3d / 2) + 0.2
         
-        # Check against existing labels
-        adjusted_y = base_label_y
-        
-        collision = True
-        while collision:
-            collision = False
-            for (lx, ly, lz) in placed_labels:
-                # Check 2D distance in the viewing plane (X/Y)
-                # We mainly care if they overlap in X and Y.
-                dist_x = abs(cx3d_base - lx)
-                dist_y = abs(adjusted_y - ly)
-                
-                # If they are close horizontally AND vertically
-                if dist_x < 0.5 and dist_y < LABEL_HEIGHT:
-                    collision = True
-                    adjusted_y += LABEL_HEIGHT # Move up
-                    break
-        
-        placed_labels.append((cx3d_base, adjusted_y, z_pos))
+        # Move up past existing labels that are close horizontally AND
+        # vertically (2D distance in the viewing plane)
+        adjusted_y = label_grid.place(cx3d_base, base_label_y)
         
         # Calculate local offset for the entity relative to the parent position
         # Parent is at {cx3d_base} {cy3d_base} {z_pos}
@@ -159,20 +531,59 @@ def create_aframe_scene(detections, image_path, depth_path, depth_array, img_w,
             <!-- Floating Label -->
             <!-- Use collision-adjusted Y position -->
             <a-entity position="0 {local_label_y} 0" look-at="[camera]">
-                <a-text value="{label}" color="white" align="center" width="4" shader="msdf" font="https://raw.githubusercontent.com/etiennepinchon/aframe-fonts/master/fonts/orbitron/Orbitron-Black.json"></a-text>
-                <a-text value="{conf:.0%}" position="0 -0.15 0" color="#ddd" align="center" width="2.5"></a-text>
+                <a-text value="{label}" color="white" align="center" width="4" shader="msdf" font="{vendor_url}Orbitron-Black.json"></a-text>
+                <a-text value="{conf:.0%}" position="0 -0.15 0" color="#ddd" align="center" width="2.5" font="{vendor_url}Roboto-msdf.json"></a-text>
                 <!-- Connecting Line if moved far -->
                 <a-entity line="start: 0 {-local_label_y + h3d/2} 0; end: 0 -0.25 0; color: {color}; opacity: 0.5"></a-entity>
             </a-entity>
         </a-entity>
         """)
 
+    return ''.join(scene_objects)
+
+
+def create_aframe_scene(detections, image_path, depth_path, depth_array, img_w, img_h, output_file,
+                        segments=VR_MESH_SEGMENTS, asset_base_url=None, mesh_path=None,
+                        vendor_url="vendor/"):
+    """
+    Generates a Full 3D A-Frame scene using Displacement Maps.
+    
+    Args:
+        detections: List of dicts with Box, Label, Conf.
+        image_path: Path/DataURI to the RGB image.
+        depth_path: Path/DataURI to the Depth map image.
+        depth_array: Numpy array of depth values (normalized 0-255 or 0-1).
+            Can be smaller than the image (e.g. depth working resolution).
+        img_w, img_h: Dimensions.
+        output_file: Output path, or None to only return the HTML.
+        segments: Plane mesh resolution (level of detail). depth_path should
+            point to a map of the same size, see make_displacement_map().
+        asset_base_url: If given, image/depth are files published under this
+            URL prefix (e.g. written with write_asset() to a static folder).
+        mesh_path: Optional pre-baked .glb from build_depth_glb(). It replaces
+            the runtime-displaced plane (depth_path is then not used).
+        vendor_url: URL prefix of the offline A-Frame bundle (VR_VENDOR_ASSETS),
+            e.g. the folder from install_vendor_assets(). Nothing is loaded
+            from the internet.
+    Returns:
+        output_file, or the HTML string if output_file is None.
+    """
+    
+    # Resolve Paths (relative to the HTML file so assets can live in a shared folder)
+    rel_image_path = _asset_src(image_path, output_file, asset_base_url)
+    if mesh_path is not None:
+        wall = _wall_entity(rel_image_path, None, _asset_src(mesh_path, output_file, asset_base_url),
+                            img_w, img_h, segments)
+    else:
+        wall = _wall_entity(rel_image_path, _asset_src(depth_path, output_file, asset_base_url), None,
+                            img_w, img_h, segments)
+    scene_objects = [wall, _evidence_entities(detections, depth_array, img_w, img_h, vendor_url)]
+
     html_content = f"""<!DOCTYPE html>
 <html>
   <head>
     <title>Full 3D Evidence Scene</title>
-    <script src="https://aframe.io/releases/1.4.0/aframe.min.js"></script>
-    <script src="https://unpkg.com/aframe-look-at-component@0.8.0/dist/aframe-look-at-component.min.js"></script>
+    {_vendor_script_tags(vendor_url)}
   </head>
   <body>
     <a-scene background="color: #050505" fog="type: exponential; color: #000; density: 0.05">
@@ -196,14 +607,263 @@ def create_aframe_scene(detections, image_path, depth_path, depth_array, img_w,
       
       <!-- Environment Context -->
       <a-grid helper geometry="primitive: plane; width: 100; height: 100" rotation="-90 0 0" 
-              material="src: url(https://cdn.aframe.io/a-painter/images/floor.jpg); repeat: 50 50; metalness: 0.6; roughness: 0.4; color: #333"></a-grid>
+              material="src: url({vendor_url}floor.jpg); repeat: 50 50; metalness: 0.6; roughness: 0.4; color: #333"></a-grid>
     
     </a-scene>
   </body>
 </html>
 """
     
+    if output_file is None:
+        return html_content
+    
     with open(output_file, "w", encoding='utf-8') as f:
         f.write(html_content)
     
     return output_file
+
+
+def make_gallery_entry(name, detections, image_path, depth_path, depth_array, img_w, img_h,
+                       mesh_path=None, segments=VR_MESH_SEGMENTS, vendor_url="vendor/"):
+    """
+    Precomputes one scene of a case VR gallery (see create_vr_gallery()).
+
+    Only the asset paths and the evidence markup are kept, so an entry is a
+    few KB and the depth array does not have to stay in memory.
+    """
+    return {
+        "Name": name,
+        "Count": len(detections),
+        "Image": image_path,
+        "Depth": depth_path,
+        "Mesh": mesh_path,
+        "Size": (img_w, img_h),
+        "Segments": segments,
+        "Evidence": _evidence_entities(detections, depth_array, img_w, img_h, vendor_url)
+    }
+
+
+def create_vr_gallery(entries, output_file, title="Case VR Gallery", asset_base_url=None,
+                      vendor_url="vendor/"):
+    """
+    Generates one A-Frame page to walk through every scene of a case.
+
+    Scenes are kept as markup in a JSON manifest. Only the current scene is
+    attached to the DOM, so its textures/mesh are fetched when the user
+    navigates to it, and the previous scene's GPU resources are disposed.
+    Memory stays flat however many scenes the case has.
+
+    Args:
+        entries: List of make_gallery_entry() dicts, in display order.
+        output_file: Output path, or None to only return the HTML.
+        asset_base_url: See create_aframe_scene().
+        vendor_url: See create_aframe_scene().
+    Returns:
+        output_file, or the HTML string if output_file is None.
+    """
+    manifest = []
+    for entry in entries:
+        img_w, img_h = entry["Size"]
+        image_src = _asset_src(entry["Image"], output_file, asset_base_url)
+        if entry["Mesh"] is not None:
+            wall = _wall_entity(image_src, None, _asset_src(entry["Mesh"], output_file, asset_base_url),
+                                img_w, img_h, entry["Segments"])
+        else:
+            wall = _wall_entity(image_src, _asset_src(entry["Depth"], output_file, asset_base_url), None,
+                                img_w, img_h, entry["Segments"])
+        manifest.append({"name": entry["Name"], "count": entry["Count"], "html": wall + entry["Evidence"]})
+
+    # "</" must not appear inside the <script> block
+    manifest_json = json.dumps(manifest).replace("</", "<\\/")
+    options = "".join(f'<option value="{i}">{html.escape(s["name"])} ({s["count"]} items)</option>'
+                      for i, s in enumerate(manifest))
+
+    html_content = f"""<!DOCTYPE html>
+<html>
+  <head>
+    <title>{html.escape(title)}</title>
+    {_vendor_script_tags(vendor_url)}
+    <style>
+      #gallery-ui {{ position: fixed; top: 1rem; left: 1rem; z-index: 10; display: flex; gap: 0.5rem;
+                     font-family: sans-serif; }}
+      #gallery-ui button, #gallery-ui select {{ background: #111; color: #eee; border: 1px solid #a855f7;
+                     border-radius: 6px; padding: 0.4rem 0.8rem; }}
+    </style>
+    <script>
+      // Attaches one scene at a time under #scene-root and frees the previous one
+      AFRAME.registerComponent('scene-gallery', {{
+        init: function () {{
+          this.scenes = JSON.parse(document.getElementById('scene-manifest').textContent);
+          this.root = document.getElementById('scene-root');
+          this.hud = document.getElementById('scene-hud');
+          this.picker = document.getElementById('scene-picker');
+          this.current = -1;
+
+          var self = this;
+          window.addEventListener('keydown', function (e) {{
+            if (e.key === 'ArrowRight' || e.key === 'PageDown') self.show(self.current + 1);
+            if (e.key === 'ArrowLeft' || e.key === 'PageUp') self.show(self.current - 1);
+          }});
+          document.getElementById('scene-prev').addEventListener('click', function () {{ self.show(self.current - 1); }});
+          document.getElementById('scene-next').addEventListener('click', function () {{ self.show(self.current + 1); }});
+          this.picker.addEventListener('change', function () {{ self.show(parseInt(self.picker.value, 10)); }});
+          document.getElementById('vr-prev').addEventListener('click', function () {{ self.show(self.current - 1); }});
+          document.getElementById('vr-next').addEventListener('click', function () {{ self.show(self.current + 1); }});
+
+          var start = parseInt(window.location.hash.slice(1), 10);
+          this.show(isNaN(start) ? 0 : start - 1);
+        }},
+
+        show: function (index) {{
+          var n = this.scenes.length;
+          if (!n) return;
+          index = ((index % n) + n) % n;
+          if (index === this.current) return;
+
+          this.unload();
+          // Creating the entities is what fetches this scene's textures
+          this.root.innerHTML = this.scenes[index].html;
+          this.current = index;
+
+          var scene = this.scenes[index];
+          this.hud.setAttribute('value', scene.name + '  (' + (index + 1) + '/' + n + ')');
+          this.picker.value = String(index);
+          history.replaceState(null, '', '#' + (index + 1));
+        }},
+
+        unload: function () {{
+          // Free GPU memory (geometry, materials, textures) of the current scene
+          this.root.object3D.traverse(function (obj) {{
+            if (obj.geometry) obj.geometry.dispose();
+            if (!obj.material) return;
+            (Array.isArray(obj.material) ? obj.material : [obj.material]).forEach(function (mat) {{
+              Object.keys(mat).forEach(function (key) {{
+                if (mat[key] && mat[key].isTexture) mat[key].dispose();
+              }});
+              mat.dispose();
+            }});
+          }});
+          while (this.root.firstChild) this.root.removeChild(this.root.firstChild);
+
+          // Drop cached image textures so the browser can release them too
+          var materials = this.el.sceneEl.systems.material;
+          if (materials && materials.clearTextureCache) materials.clearTextureCache();
+        }}
+      }});
+    </script>
+  </head>
+  <body>
+    <div id="gallery-ui">
+      <button id="scene-prev">&larr;</button>
+      <select id="scene-picker">{options}</select>
+      <button id="scene-next">&rarr;</button>
+    </div>
+    <script type="application/json" id="scene-manifest">{manifest_json}</script>
+
+    <a-scene scene-gallery background="color: #050505" fog="type: exponential; color: #000; density: 0.05">
+      
+      <!-- Ambient Light -->
+      <a-light type="ambient" color="#222"></a-light>
+      
+      <!-- Spotlight on the evidence wall -->
+      <a-light type="spot" position="0 4 2" color="#a855f7" intensity="0.8" angle="60" penumbra="0.5"></a-light>
+      <a-light type="point" position="2 2 2" intensity="0.4" color="#fff"></a-light>
+
+      <!-- Player Rig -->
+      <a-entity id="rig" position="0 1.6 2">
+        <a-camera look-controls wasd-controls="acceleration: 20">
+            <a-cursor color="#a855f7" scale="0.5 0.5 0.5"></a-cursor>
+        </a-camera>
+      </a-entity>
+
+      <!-- Current scene (swapped by scene-gallery) -->
+      <a-entity id="scene-root"></a-entity>
+
+      <!-- In-VR navigation (gaze/click) -->
+      <a-text id="scene-hud" position="0 {WALL_Y + 4.2} {WALL_Z}" align="center" width="8" color="#eee"
+              font="{vendor_url}Roboto-msdf.json"></a-text>
+      <a-entity id="vr-prev" position="{WALL_X - WALL_WIDTH / 2 - 1} {WALL_Y} {WALL_Z + 1}" look-at="[camera]"
+                geometry="primitive: circle; radius: 0.4" material="color: #a855f7; opacity: 0.8">
+        <a-text value="&lt;" align="center" width="6" font="{vendor_url}Roboto-msdf.json"></a-text>
+      </a-entity>
+      <a-entity id="vr-next" position="{WALL_X + WALL_WIDTH / 2 + 1} {WALL_Y} {WALL_Z + 1}" look-at="[camera]"
+                geometry="primitive: circle; radius: 0.4" material="color: #a855f7; opacity: 0.8">
+        <a-text value="&gt;" align="center" width="6" font="{vendor_url}Roboto-msdf.json"></a-text>
+      </a-entity>
+      
+      <!-- Environment Context -->
+      <a-grid helper geometry="primitive: plane; width: 100; height: 100" rotation="-90 0 0" 
+              material="src: url({vendor_url}floor.jpg); repeat: 50 50; metalness: 0.6; roughness: 0.4; color: #333"></a-grid>
+    
+    </a-scene>
+  </body>
+</html>
+"""
+
+    if output_file is None:
+        return html_content
+
+    with open(output_file, "w", encoding='utf-8') as f:
+        f.write(html_content)
+
+    return output_file
+
+
+def create_vr_index(scenes, output_file, title="Case VR Scenes", gallery=None):
+    """
+    Writes a case index page linking to every generated VR scene.
+
+    Args:
+        scenes: List of dicts with Name, Scene (HTML path), Thumb (image path), Count.
+        output_file: Output path.
+        gallery: Optional create_vr_gallery() page to link at the top.
+    """
+    cards = []
+    for scene in scenes:
+        cards.append(f"""
+        <a class="card" href="{html.escape(_relative_url(os.path.abspath(scene['Scene']), output_file))}">
+            <img src="{html.escape(_relative_url(os.path.abspath(scene['Thumb']), output_file))}" loading="lazy">
+            <span>{html.escape(scene['Name'])} &middot; {scene['Count']} items</span>
+        </a>""")
+
+    gallery_link = ""
+    if gallery is not None:
+        gallery_link = f"""
+    <p><a class="walk" href="{html.escape(_relative_url(os.path.abspath(gallery), output_file))}">Walk through all scenes in VR &rarr;</a></p>"""
+
+    html_content = f"""<!DOCTYPE html>
+<html>
+  <head>
+    <title>{html.escape(title)}</title>
+    <style>
+      body {{ background: #050505; color: #eee; font-family: sans-serif; margin: 2rem; }}
+      .grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(240px, 1fr)); gap: 1rem; }}
+      .card {{ color: #eee; text-decoration: none; border: 1px solid #a855f7; border-radius: 8px; overflow: hidden; }}
+      .card img {{ width: 100%; height: 160px; object-fit: cover; display: block; }}
+      .card span {{ display: block; padding: 0.5rem; }}
+      .walk {{ color: #a855f7; }}
+    </style>
+  </head>
+  <body>
+    <h1>{html.escape(title)}</h1>{gallery_link}
+    <div class="grid">{''.join(cards)}
+    </div>
+  </body>
+</html>
+"""
+
+    with open(output_file, "w", encoding='utf-8') as f:
+        f.write(html_content)
+
+    return output_file
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--fetch-vendor" in sys.argv:
+        fetch_vendor_assets()
+        print(f"[VR] Offline bundle ready in '{VR_VENDOR_DIR}/'")
+    else:
+        check_vendor_assets()
+        print(f"[VR] Offline bundle OK in '{VR_VENDOR_DIR}/'")
@@ -1,9 +1,13 @@
 import cv2
 from ultralytics import YOLO
-import pandas as pd
 from datetime import datetime
 import os
-import glob
+import time
+from evidence_store import EvidenceStore, export_csv
+from evidence_index import EvidenceIndex, EVIDENCE_INDEX_PATH
+from detections import Detections
+from image_io import read_image, iter_images, input_root, image_name
+from dedupe import Deduplicator
 
 
 class CrimeSceneBatchDetector:
@@ -13,9 +17,13 @@ class CrimeSceneBatchDetector:
         """
         print(f"[INIT] Loading forensic model: {model_weights}...")
         self.model = YOLO(model_weights)
+        self.model_weights = model_weights
 
         # --- CONFIGURATION ---
         self.CONFIDENCE_CUTOFF = 0.45
+        # Larger photos are decoded at 1/2, 1/4 or 1/8 scale (long side stays >= this);
+        # detections are logged in original pixels. None = always full resolution.
+        self.WORKING_MAX_SIDE = 2048
 
         # Evidence Classes
         self.evidence_classes = {
@@ -34,98 +42,124 @@ class CrimeSceneBatchDetector:
             "text": (255, 255, 255)  # White
         }
 
-    def process_directory(self, input_dir, output_root='evidence_reports'):
+    def process_directory(self, input_dir, output_root='evidence_reports', write_csv=False,
+                          index_path=EVIDENCE_INDEX_PATH, dedupe=None):
         """
-        Iterates through a directory of images and processes them one by one.
+        Iterates through a directory of images (a folder or a glob such as
+        "crime_scenes/*", subfolders included) and processes them one by one.
+        Detections above the cutoff go to the columnar evidence store in
+        '<output_root>/evidence_store/' (the official log is the evidence
+        classes among them), the full raw stream to the run's binary debug
+        log (debug_log.py). write_csv=True also exports the old
+        _EVIDENCE.csv / _DEBUG.csv files. Images are also added to the SQLite
+        evidence index at index_path (None to skip).
+        dedupe="reuse" / "skip": near-duplicate images (dedupe.py) get the first
+        copy's detections / are left out; clusters go to '<output_root>/dedupe_<run>.json'.
         """
         # 1. Setup Output Directory Structure
         visuals_dir = os.path.join(output_root, "visuals")
-        official_dir = os.path.join(output_root, "official_logs")
-        debug_dir = os.path.join(output_root, "debug_data")
-
-        for d in [visuals_dir, official_dir, debug_dir]:
-            os.makedirs(d, exist_ok=True)
+        store_dir = os.path.join(output_root, "evidence_store")
+        os.makedirs(visuals_dir, exist_ok=True)
 
         # 2. Find All Images
-        # Looks for jpg, jpeg, png (case in-sensitive usually, but explicit here)
-        image_files = glob.glob(input_dir)
+        # Streamed walk (subfolders included); only files with an image extension,
+        # a sane size and image magic bytes are decoded
+        image_files = iter_images(input_dir, exclude=[output_root])
+        # Image names are relative to it, so same-named files in subfolders stay apart
+        root = input_root(input_dir)
 
-        print(f"[INFO] Found {len(image_files)} images in '{input_dir}'")
+        print(f"[INFO] Scanning '{input_dir}' for images")
 
         # 3. Process Each Image
-        for i, img_path in enumerate(image_files):
-            print(f"\n[{i + 1}/{len(image_files)}] Processing: {os.path.basename(img_path)}...")
-            self._analyze_single_image(img_path, visuals_dir, official_dir, debug_dir)
-
-        print(f"\n[COMPLETE] Batch processing finished. Results in '{output_root}/'")
-
-    def _analyze_single_image(self, image_path, visuals_dir, official_dir, debug_dir):
+        metadata = {"input": input_dir, "model_weights": self.model_weights,
+                    "confidence_cutoff": self.CONFIDENCE_CUTOFF, "dedupe": dedupe}
+        index = EvidenceIndex(index_path) if index_path else None
+        deduper = Deduplicator(reuse=(dedupe == "reuse")) if dedupe else None
+        with EvidenceStore(store_dir, tool="yolo_marked", metadata=metadata, index=index,
+                           debug_log=True, cutoff=self.CONFIDENCE_CUTOFF) as store:
+            for i, img_path in enumerate(image_files):
+                print(f"\n[{i + 1}] Processing: {os.path.relpath(img_path, root)}...")
+                self._analyze_single_image(img_path, visuals_dir, store, deduper, root)
+        if index is not None:
+            index.close()
+
+        if deduper is not None:
+            deduper.save(os.path.join(output_root, f"dedupe_{store.run_id}.json"))
+            print(deduper.summary_line())
+
+        if write_csv:
+            export_csv(output_root, store_dir, tool="yolo_marked", run=store.run_id)
+
+        print(f"\n[COMPLETE] Batch processing finished ({store.n_images} images). "
+              f"Results in '{output_root}/' (run {store.run_id})")
+
+    def _analyze_single_image(self, image_path, visuals_dir, store, dedupe=None, root=None):
         """
-        Internal helper to process one image and save its 3 specific output files.
+        Internal helper to process one image, save its visual and log its detections.
+        Outputs are named after the path relative to root (see image_io.image_name).
         """
-        img = cv2.imread(image_path)
+        img, scale, size = read_image(image_path, self.WORKING_MAX_SIDE)
         if img is None:
             print(f"[ERROR] Skipped corrupt file: {image_path}")
             return
+        orig_w, orig_h = size
 
         # Get filename without extension for saving
-        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        base_name = image_name(image_path, root)
 
-        # --- INFERENCE (Get Everything) ---
-        results = self.model.predict(source=img, conf=0.001, iou=0.5, verbose=False)[0]
+        # --- NEAR-DUPLICATE CHECK ---
+        original = dedupe.check(image_path, img) if dedupe is not None else None
+        if original is not None and not dedupe.reuse:
+            print(f"   -> Skipped: near-duplicate of {image_name(original, root)}")
+            return
 
-        debug_log_all = []
-        official_evidence_log = []
+        if original is not None:
+            # STREAM A from the first copy (rescaled to this image)
+            prev, prev_w = dedupe.results[original]
+            dets = prev.scaled(orig_w / prev_w).clip(orig_w, orig_h)
+            print(f"   -> Near-duplicate of {image_name(original, root)}, reusing its detections")
+        else:
+            # --- INFERENCE (Get Everything) ---
+            start = time.perf_counter()
+            results = self.model.predict(source=img, conf=0.001, iou=0.5, verbose=False)[0]
+
+            # --- PROCESSING ---
+            # STREAM A: DEBUG LOG (All Detections, evidence classes flagged)
+            dets = Detections.from_yolo(results, self.model_weights, self.evidence_classes, keep_all=True,
+                                        scale=scale)
+            if dedupe is not None:
+                if dedupe.reuse:
+                    dedupe.results[image_path] = (dets, orig_w)
+                dedupe.record_time(time.perf_counter() - start)
+
+        timestamp = datetime.now()
         annotated_img = img.copy()
-        class_names = results.names
-
-        # --- PROCESSING ---
-        for box in results.boxes:
-            cls_id = int(box.cls[0])
-            conf = float(box.conf[0])
-            raw_label = class_names[cls_id]
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-            is_evidence_type = cls_id in self.evidence_classes
-            evidence_label = self.evidence_classes.get(cls_id, raw_label)
-
-            # STREAM A: DEBUG LOG (All Detections)
-            debug_log_all.append({
-                "Source_Image": base_name,
-                "Object_Type": raw_label,
-                "Confidence": conf,
-                "Is_Evidence_Class": is_evidence_type,
-                "Box": [x1, y1, x2, y2]
-            })
-
-            # STREAM B: OFFICIAL LOGIC (>45% & Evidence Class)
-            if is_evidence_type and conf > self.CONFIDENCE_CUTOFF:
-
-                # Add to CSV
-                official_evidence_log.append({
-                    "Timestamp": datetime.now().isoformat(),
-                    "Source_Image": base_name,
-                    "Evidence_Type": evidence_label,
-                    "Confidence": f"{conf:.2%}",
-                    "Location": [x1, y1, x2, y2]
-                })
-
-                # Draw Visuals
-                if "Weapon" in evidence_label or "Knife" in evidence_label:
-                    c = self.colors["weapon"]
-                elif "Digital" in evidence_label or "Phone" in evidence_label:
-                    c = self.colors["digital"]
-                else:
-                    c = self.colors["general"]
-
-                cv2.rectangle(annotated_img, (x1, y1), (x2, y2), c, 2)
-
-                # Label
-                lbl_text = f"{evidence_label.split('(')[0]} {conf:.0%}"
-                (w, h), _ = cv2.getTextSize(lbl_text, cv2.FONT_HERSHEY_SIMPLEX, 1.2, 3)
-                cv2.rectangle(annotated_img, (x1, y1 - h - 10), (x1 + w + 10, y1), self.colors["background"], -1)
-                cv2.putText(annotated_img, lbl_text, (x1 + 5, y1 - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1.2, self.colors["text"], 3)
+
+        # STREAM B: OFFICIAL LOGIC (>45% & Evidence Class)
+        official = dets[dets.evidence_class & (dets.conf > self.CONFIDENCE_CUTOFF)]
+        n_official = len(official)
+
+        for item in official.scaled(scale).items():
+            evidence_label = item['Label']
+            conf = item['Conf']
+            x1, y1, x2, y2 = item['Box']
+
+            # Draw Visuals
+            if "Weapon" in evidence_label or "Knife" in evidence_label:
+                c = self.colors["weapon"]
+            elif "Digital" in evidence_label or "Phone" in evidence_label:
+                c = self.colors["digital"]
+            else:
+                c = self.colors["general"]
+
+            cv2.rectangle(annotated_img, (x1, y1), (x2, y2), c, 2)
+
+            # Label
+            lbl_text = f"{evidence_label.split('(')[0]} {conf:.0%}"
+            (w, h), _ = cv2.getTextSize(lbl_text, cv2.FONT_HERSHEY_SIMPLEX, 1.2, 3)
+            cv2.rectangle(annotated_img, (x1, y1 - h - 10), (x1 + w + 10, y1), self.colors["background"], -1)
+            cv2.putText(annotated_img, lbl_text, (x1 + 5, y1 - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1.2, self.colors["text"], 3)
 
         # --- SAVING ---
 
@@ -133,22 +167,13 @@ class CrimeSceneBatchDetector:
         out_img_path = os.path.join(visuals_dir, f"{base_name}_VISUAL.jpg")
         cv2.imwrite(out_img_path, annotated_img)
 
-        # 2. Save Official CSV (Only if evidence found)
-        if official_evidence_log:
-            df_off = pd.DataFrame(official_evidence_log)
-            out_csv_path = os.path.join(official_dir, f"{base_name}_EVIDENCE.csv")
-            df_off.to_csv(out_csv_path, index=False)
-            print(f"   -> Evidence Found! Saved report to official logs.")
+        # 2. Log every detection (official rows are flagged, not duplicated)
+        store.append(base_name, dets, timestamp, size=(orig_w, orig_h))
+        if n_official:
+            print(f"   -> Evidence Found! {n_official} items logged as official evidence.")
         else:
             print(f"   -> Clean scene (No high-confidence evidence).")
 
-        # 3. Save Debug CSV (Always)
-        if debug_log_all:
-            df_debug = pd.DataFrame(debug_log_all)
-            df_debug = df_debug.sort_values(by="Confidence", ascending=False)
-            out_debug_path = os.path.join(debug_dir, f"{base_name}_DEBUG.csv")
-            df_debug.to_csv(out_debug_path, index=False)
-
 
 # --- EXECUTION ---
 if __name__ == "__main__":